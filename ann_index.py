@@ -0,0 +1,118 @@
+"""
+===============================================================
+ FAISS index types for the chunk corpus
+===============================================================
+   flat  exact search (IndexFlatL2); best below ~50k vectors
+   ivf   inverted lists (IndexIVFFlat); tune with nprobe
+   hnsw  graph search (IndexHNSWFlat); tune with efSearch
+
+ build_ann_index() is used by build_index.py and the benchmark;
+ tune_index() applies the query-time knobs after loading, and
+ search_parameters() carries them into per-query parameters (a
+ params object replaces the index's own nprobe / efSearch).
+
+ read_ann_index(path, mmap=True) maps flat codes and IVF lists
+ straight from the file, so every worker on the host shares one
+ copy in the page cache. HNSW graphs are always read into memory;
+ share those with gunicorn's preload instead.
+
+ shorten_vectors() cuts embeddings to fewer dimensions the way
+ text-embedding-3 models do (truncate, then L2-normalise), so a
+ smaller index can be derived from stored full-size vectors.
+===============================================================
+"""
+import math
+
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+
+
+def default_nlist(n_vectors):
+    # ~4·sqrt(n) lists, with at least ~39 training points per list
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39 or 1))
+
+
+def build_ann_index(vectors, kind="flat", nlist=None, hnsw_m=32, ef_construction=200):
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    d = vectors.shape[1]
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(d)
+    elif kind == "ivf":
+        quantizer = faiss.IndexFlatL2(d)
+        index = faiss.IndexIVFFlat(quantizer, d, nlist or default_nlist(len(vectors)))
+        index.train(vectors)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(d, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        raise ValueError(f"Unknown index type {kind!r}; expected one of {', '.join(INDEX_TYPES)}")
+
+    index.add(vectors)
+    return index
+
+
+def _mmap_flag_sets():
+    # Flat codes need IO_FLAG_MMAP_IFC, IVF lists IO_FLAG_MMAP; IVF refuses both at once
+    ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    flag_sets = [faiss.IO_FLAG_MMAP | ifc, faiss.IO_FLAG_MMAP, ifc] if ifc else [faiss.IO_FLAG_MMAP]
+    return [flags | faiss.IO_FLAG_READ_ONLY for flags in flag_sets]
+
+
+def read_ann_index(path, mmap=False):
+    """Read an index, memory-mapped read-only when asked; returns (index, mmapped)."""
+    if mmap:
+        for flags in _mmap_flag_sets():
+            try:
+                return faiss.read_index(path, flags), True
+            except RuntimeError:
+                continue
+        print(f"⚠️ {path} cannot be memory-mapped; reading it into memory")
+    return faiss.read_index(path), False
+
+
+def tune_index(index, nprobe=None, ef_search=None):
+    """Apply query-time parameters where the index type supports them."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = int(nprobe)
+    if hasattr(index, "hnsw") and ef_search:
+        index.hnsw.efSearch = int(ef_search)
+    return index
+
+
+def search_parameters(index, sel=None):
+    """SearchParameters for ``index`` with its current nprobe / efSearch and an optional id selector."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=sel, nprobe=int(ivf.nprobe))
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=int(index.hnsw.efSearch))
+    return faiss.SearchParameters(sel=sel)
+
+
+def describe_index(index):
+    info = {"type": type(index).__name__, "ntotal": int(index.ntotal), "d": int(index.d)}
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        info.update(nlist=int(ivf.nlist), nprobe=int(ivf.nprobe))
+    if hasattr(index, "hnsw"):
+        info.update(efSearch=int(index.hnsw.efSearch), efConstruction=int(index.hnsw.efConstruction))
+    return info
+
+
+def all_vectors(index):
+    """Every stored vector, in id order (IVF indexes need a direct map first)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def shorten_vectors(vectors, dimensions):
+    """The first ``dimensions`` components of each vector, L2-renormalised."""
+    shortened = np.ascontiguousarray(np.asarray(vectors, dtype="float32")[:, :dimensions])
+    faiss.normalize_L2(shortened)
+    return shortened
@@ -0,0 +1,134 @@
+"""
+===============================================================
+ Semantic answer cache
+===============================================================
+ Reuses a reviewed GPT answer when a new enquiry is a near
+ duplicate of one already answered. Past query embeddings are
+ held in a small FAISS inner-product index per
+ (discipline, rank_level) partition; a hit is any cached query
+ whose cosine similarity is at or above the threshold.
+
+ A lookup checks the ``neighbours`` nearest cached queries, so an
+ expired nearest entry does not hide a valid one just behind it.
+
+ Entries expire after ``ttl`` seconds and the least recently used
+ entry is evicted once ``max_entries`` is reached. The cache lives
+ in process memory and is created by every load_indexes(), so a
+ rebuilt corpus index (which is only picked up by a restart)
+ always starts with an empty cache.
+===============================================================
+"""
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import faiss
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold=0.95, ttl=86400, max_entries=1000, neighbours=4):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.neighbours = neighbours
+        self._lock = threading.Lock()
+        self._partitions = {}
+        self._entries = OrderedDict()  # (partition, id) -> entry, least recently used first
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def _partition(discipline, rank_level):
+        return ((discipline or "").strip().lower(), (rank_level or "").strip().lower())
+
+    @staticmethod
+    def _as_unit_row(vector):
+        row = np.array([vector], dtype="float32")
+        faiss.normalize_L2(row)
+        return row
+
+    def _remove(self, key):
+        partition, entry_id = key
+        self._entries.pop(key, None)
+        index = self._partitions.get(partition)
+        if index is not None:
+            index.remove_ids(np.array([entry_id], dtype="int64"))
+
+    def lookup(self, vector, discipline, rank_level):
+        if not self.enabled:
+            return None
+        partition = self._partition(discipline, rank_level)
+        with self._lock:
+            index = self._partitions.get(partition)
+            if index is None or index.ntotal == 0:
+                self.misses += 1
+                return None
+
+            D, I = index.search(self._as_unit_row(vector), min(self.neighbours, index.ntotal))
+            now = time.time()
+            for score, entry_id in zip(D[0].tolist(), I[0].tolist()):
+                if score < self.threshold:
+                    break  # nearest first, so no later neighbour qualifies either
+                key = (partition, entry_id)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if now - entry["created"] > self.ttl:
+                    self._remove(key)
+                    self.evictions += 1
+                    continue
+
+                self._entries.move_to_end(key)
+                entry["hits"] += 1
+                self.hits += 1
+                return dict(entry, similarity=score)
+
+            self.misses += 1
+            return None
+
+    def store(self, vector, discipline, rank_level, query, answer, context):
+        if not self.enabled:
+            return
+        partition = self._partition(discipline, rank_level)
+        with self._lock:
+            index = self._partitions.get(partition)
+            row = self._as_unit_row(vector)
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatIP(row.shape[1]))
+                self._partitions[partition] = index
+
+            entry_id = self._next_id
+            self._next_id += 1
+            index.add_with_ids(row, np.array([entry_id], dtype="int64"))
+            self._entries[(partition, entry_id)] = {
+                "query": query,
+                "answer": answer,
+                "context": context,
+                "created": time.time(),
+                "hits": 0,
+            }
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "partitions": len(self._partitions),
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "neighbours": self.neighbours,
+            }
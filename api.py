@@ -44,21 +44,29 @@
 """
 import os
 import os.path
+import io
 import json
 import base64
+import time
 import datetime
 import re
-import numpy as np
-import faiss
-import requests
 import textwrap
-from openai import OpenAI
-from flask import Flask, request, jsonify
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify, Response, stream_with_context, send_file, g
 from flask_cors import CORS
-from docx import Document
-from docx.shared import Mm, Pt, RGBColor
 from datetime import datetime
-from zoneinfo import ZoneInfo  # Python 3.9+ 
+from chunk_store import ChunkStore, DEFAULT_PACK_PATH
+from redaction import Redactor
+from outbox import MailOutbox
+from report_storage import ReportStorage, report_fingerprint
+from embedding_cache import EmbeddingCache
+from context_packer import pack_context, truncate_to_tokens, count_tokens
+from jobs import JobRunner, MemoryJobStore, SQLiteJobStore
+from timing import StageTimer, process_memory
+from metrics import registry as metrics
+from streaming import SectionStreamParser, sse
 
 
 __version__ = "v1.0.7-test"
@@ -75,11 +83,86 @@ def add_markdown_bold(paragraph, text):
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 print("🔒 OPENAI_API_KEY exists?", bool(OPENAI_API_KEY))
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = None
+
+def openai_client():
+    # The openai package is slow to import, so the client is built on first use (or by warm_up)
+    global client
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(api_key=OPENAI_API_KEY)
+    return client
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Shortened query embeddings for an index built with --dimensions; set from its manifest by load_indexes()
+EMBEDDING_DIMENSIONS = None
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")),
+    path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+    max_disk_entries=int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "20000"))
+)
+
+# 📊 Metrics for GET /metrics (Prometheus text format)
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+STAGE_SECONDS = metrics.histogram(
+    "aivs_stage_seconds", "Time spent in each /generate stage; draft and review are the OpenAI calls inside generation", ["stage"])
+REQUEST_SECONDS = metrics.histogram("aivs_request_seconds", "HTTP request latency", ["method", "endpoint", "status"])
+OPENAI_TOKENS = metrics.counter("aivs_openai_tokens_total", "Tokens reported in OpenAI usage", ["call", "kind"])
+REVIEW_DECISIONS = metrics.counter("aivs_review_decisions_total", "Review pass run or skipped", ["strategy", "decision", "reason"])
+ANSWER_CACHE_RESULTS = metrics.counter("aivs_answer_cache_total", "Answer cache lookups", ["result"])
+CONTEXT_TOKENS = metrics.histogram(
+    "aivs_context_tokens", "Tokens of policy context sent to the model", buckets=(250, 500, 750, 1000, 1250, 1500, 1800, 2500, 4000))
+MAIL_RESULTS = metrics.counter("aivs_mail_total", "Report deliveries by Mailjet status (or queued)", ["status"])
+StageTimer.observers.append(lambda stage, seconds: STAGE_SECONDS.observe(seconds, stage=stage))
+if METRICS_DIR:
+    metrics.start_exporter(METRICS_DIR)
+
+def record_usage(call, usage):
+    if usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if tokens:
+            OPENAI_TOKENS.inc(tokens, call=call, kind=kind)
+
+def embedding_options():
+    return {"dimensions": EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {}
+
+def embedding_cache_model():
+    # Vectors of different sizes must not share cache entries
+    return f"{EMBEDDING_MODEL}:{EMBEDDING_DIMENSIONS}" if EMBEDDING_DIMENSIONS else EMBEDDING_MODEL
+
+def embed_query(text):
+    def create(query):
+        response = openai_client().embeddings.create(input=[query], model=EMBEDDING_MODEL, **embedding_options())
+        record_usage("embedding", getattr(response, "usage", None))
+        return response.data[0].embedding
+    return embedding_cache.get_or_create(text, embedding_cache_model(), create)
+
+def embed_queries(texts):
+    """Vectors for several queries, with every cache miss sent in a single embeddings request."""
+    def create(queries):
+        response = openai_client().embeddings.create(input=queries, model=EMBEDDING_MODEL, **embedding_options())
+        record_usage("embedding", getattr(response, "usage", None))
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+    return embedding_cache.get_or_create_many(texts, embedding_cache_model(), create)
 
 app = Flask(__name__)
 CORS(app, origins=["https://www.aivs.uk"])
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    # Streaming responses are timed up to the first byte
+    started = g.get("request_started")
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint, status=response.status_code)
+    return response
+
 @app.route("/", methods=["GET"])
 def home():
     return "✅ Police Procedures API is running", 200
@@ -97,18 +180,255 @@ def ping():
         return '', 204
     return jsonify({"message": "pong"})
 
-# Load FAISS index
-try:
-    faiss_index = faiss.read_index("faiss_index/police_chunks.index")
-    with open("faiss_index/police_metadata.json", "r", encoding="utf-8") as f:
-        metadata = json.load(f)
-    print("✅ FAISS index and metadata loaded.")
-except Exception as e:
-    faiss_index = None
-    metadata = []
-    print("⚠️ Failed to load FAISS index:", str(e))
-
-def ask_gpt_with_context(data, context):
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    # Liveness only: the process is up and serving requests
+    return jsonify({"status": "alive", "pid": os.getpid()})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    # Warm-up is best effort: a failed warm-up only makes the first requests slower
+    ready = indexes_ready.is_set() and STARTUP["index_loaded"]
+    return jsonify({
+        "ready": ready,
+        "loading": not indexes_ready.is_set(),
+        "index_loaded": STARTUP["index_loaded"],
+        "vectors": STARTUP["vectors"],
+        "warmed_up": STARTUP["warmed_up"],
+        "index_load_s": STARTUP.get("index_load_s"),
+        "warm_up_s": STARTUP.get("warm_up_s"),
+        "error": STARTUP["error"]
+    }), 200 if ready else 503
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(METRICS_DIR), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "mail_outbox": mail_outbox.stats() if mail_outbox else None,
+        "report_storage": report_storage.stats() if report_storage else None,
+        "process": dict(STARTUP, pid=os.getpid(), **process_memory())
+    })
+
+def load_metadata():
+    from metadata_store import MetadataStore, DEFAULT_METADATA_STORE_PATH
+
+    # Columnar store (built by metadata_store.py) first, then the JSON files
+    store_path = os.getenv("METADATA_STORE_PATH", DEFAULT_METADATA_STORE_PATH)
+    if os.path.exists(store_path):
+        return MetadataStore.open(store_path)
+    # Tagged metadata carries a discipline per chunk; the plain file is the fallback
+    metadata_path = "faiss_index/police_metadata_tagged.json"
+    if not os.path.exists(metadata_path):
+        metadata_path = "faiss_index/police_metadata.json"
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        return MetadataStore.from_entries(json.load(f))
+
+def load_manifest(index_path):
+    """The build manifest written next to the index by build_index.py ({} when there is none)."""
+    manifest_path = re.sub(r"\.index$", "", index_path) + ".manifest.json"
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def query_dimensions(index, manifest):
+    """Embedding size to request for queries: None (the model's full size) unless the index holds shortened vectors."""
+    if manifest.get("model", EMBEDDING_MODEL) != EMBEDDING_MODEL:
+        print(f"⚠️ Index was built with {manifest['model']}, queries use {EMBEDDING_MODEL}")
+    shortened = manifest.get("shortened") if manifest else os.getenv("EMBEDDING_DIMENSIONS")
+    return int(index.d) if shortened else None
+
+def discipline_key(name):
+    key = re.sub(r"[^a-z0-9]+", "_", (name or "").lower()).strip("_")
+    return key[len("police_"):] if key.startswith("police_") else key
+
+# Indexes are loaded by load_indexes(), in a background thread by default (INDEX_LOAD below);
+# numpy and FAISS are imported there too, so the worker answers /healthz straight away
+FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "faiss_index/police_chunks.index")
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0").lower() in ("1", "true", "yes")
+DISCIPLINE_MIN_PARTITION = int(os.getenv("DISCIPLINE_MIN_PARTITION", "50"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+INDEX_WAIT_SECONDS = float(os.getenv("INDEX_WAIT_SECONDS", "60"))
+
+STARTUP = {"pid": os.getpid(), "index_loaded": False, "vectors": 0, "faiss_mmap": False, "warmed_up": False, "error": None}
+indexes_ready = threading.Event()
+np = faiss = reciprocal_rank_fusion = None
+answer_cache = None
+faiss_index = None
+metadata = []
+chunk_store = None
+bm25_index = None
+discipline_partitions = {}
+redactor = Redactor.from_file()
+context_pre_redacted = False
+
+def load_indexes():
+    global np, faiss, reciprocal_rank_fusion, answer_cache, faiss_index, metadata, EMBEDDING_DIMENSIONS
+    global chunk_store, bm25_index, discipline_partitions, context_pre_redacted
+    started = time.perf_counter()
+
+    import numpy as np
+    import faiss
+    from ann_index import read_ann_index, tune_index, search_parameters, describe_index
+    from bm25_index import BM25Index, DEFAULT_BM25_PATH, reciprocal_rank_fusion
+    from answer_cache import SemanticAnswerCache
+
+    # Created with each load: a rebuilt index is only picked up by a restart, which starts the cache empty
+    answer_cache = SemanticAnswerCache(
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+        ttl=int(os.getenv("ANSWER_CACHE_TTL", "86400")),
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+        neighbours=int(os.getenv("ANSWER_CACHE_NEIGHBOURS", "4"))
+    )
+
+    # Load FAISS index (memory-mapped read-only with FAISS_MMAP=1, so workers share its pages)
+    try:
+        faiss_index, STARTUP["faiss_mmap"] = read_ann_index(FAISS_INDEX_PATH, mmap=FAISS_MMAP)
+        tune_index(faiss_index, nprobe=os.getenv("FAISS_NPROBE"), ef_search=os.getenv("FAISS_EF_SEARCH"))
+        metadata = load_metadata()
+        EMBEDDING_DIMENSIONS = query_dimensions(faiss_index, load_manifest(FAISS_INDEX_PATH))
+        if EMBEDDING_DIMENSIONS:
+            print(f"✂️ Query embeddings shortened to {EMBEDDING_DIMENSIONS} dims to match the index")
+        print("✅ FAISS index and metadata loaded:", describe_index(faiss_index), "(mmap)" if STARTUP["faiss_mmap"] else "")
+    except Exception as e:
+        faiss_index = None
+        metadata = []
+        STARTUP["error"] = f"FAISS index not loaded: {e}"
+        print("⚠️ Failed to load FAISS index:", str(e))
+
+    # Load packed chunk texts (built by chunk_store.py); fall back to data/ files
+    try:
+        store = ChunkStore(os.getenv("CHUNK_PACK_PATH", DEFAULT_PACK_PATH))
+        if len(store) != len(metadata):
+            raise ValueError(f"pack has {len(store)} chunks, metadata has {len(metadata)}")
+        chunk_store = store
+        print(f"✅ Chunk pack mapped: {chunk_store.path}")
+    except Exception as e:
+        print("⚠️ Chunk pack not available, reading data/ files:", str(e))
+
+    # Stored chunks are pre-redacted when the pack's stamp matches the current term list
+    context_pre_redacted = chunk_store is not None and chunk_store.header.get("redaction_version") == redactor.version
+    if context_pre_redacted:
+        print(f"✅ Chunk pack redaction version {redactor.version} is current")
+    else:
+        print(f"⚠️ Redacting context per request (redaction version {redactor.version})")
+
+    # Per-discipline id selectors, so a request's discipline restricts the search
+    if faiss_index is not None:
+        ids_by_discipline = {}
+        for name, ids in metadata.ids_by_discipline().items():
+            ids_by_discipline.setdefault(discipline_key(name), []).append(ids)
+        partitions = {}
+        for key, parts in ids_by_discipline.items():
+            ids = np.sort(np.concatenate(parts))
+            mask = np.zeros(len(metadata), dtype=bool)
+            mask[ids] = True
+            partitions[key] = {
+                "ids": ids,
+                "mask": mask,
+                # Built after tune_index so the partition keeps the tuned nprobe / efSearch
+                "params": search_parameters(faiss_index, faiss.IDSelectorBatch(ids))
+            }
+        discipline_partitions = partitions
+        print("🗂️ Discipline partitions:", {k: len(v["ids"]) for k, v in discipline_partitions.items()})
+
+    # Lexical (BM25) index for hybrid retrieval, built by bm25_index.py
+    try:
+        lexical = BM25Index(os.getenv("BM25_INDEX_PATH", DEFAULT_BM25_PATH))
+        if len(lexical) != len(metadata):
+            raise ValueError(f"BM25 index has {len(lexical)} chunks, metadata has {len(metadata)}")
+        bm25_index = lexical
+        print(f"✅ BM25 index loaded: {len(bm25_index.vocab)} terms")
+    except Exception as e:
+        print("⚠️ BM25 index not available, using vector search only:", str(e))
+
+    STARTUP["index_loaded"] = faiss_index is not None
+    STARTUP["vectors"] = int(faiss_index.ntotal) if faiss_index is not None else 0
+    STARTUP["dimensions"] = int(faiss_index.d) if faiss_index is not None else None
+    STARTUP["index_load_s"] = round(time.perf_counter() - started, 3)
+    STARTUP.update(process_memory())
+    print(f"🧮 Startup (pid {STARTUP['pid']}): indexes loaded in {STARTUP['index_load_s']}s, "
+          f"RSS {STARTUP['rss_mb']} MB" + (" (FAISS mmap)" if STARTUP["faiss_mmap"] else ""))
+
+def warm_up():
+    """Touch every lazily-initialised path once so the first real request does not pay for it."""
+    started = time.perf_counter()
+    if faiss_index is not None:
+        rank_chunks("stop and search", np.zeros(faiss_index.d, dtype="float32"), 2)
+    from report_renderer import new_document
+    new_document()
+    count_tokens("warm up")
+    openai_client()
+    mailer()
+    STARTUP["warmed_up"] = True
+    STARTUP["warm_up_s"] = round(time.perf_counter() - started, 3)
+    print(f"🔥 Warm-up done in {STARTUP['warm_up_s']}s")
+
+def load_and_warm_up():
+    try:
+        load_indexes()
+    except Exception as e:
+        STARTUP["error"] = f"Index loading failed: {e}"
+        print("❌ Index loading failed:", str(e))
+    finally:
+        indexes_ready.set()
+    try:
+        warm_up()
+    except Exception as e:
+        STARTUP["error"] = STARTUP["error"] or f"Warm-up failed: {e}"
+        print("⚠️ Warm-up failed:", str(e))
+
+def wait_for_indexes():
+    if not indexes_ready.wait(INDEX_WAIT_SECONDS):
+        print(f"⚠️ Indexes still loading after {INDEX_WAIT_SECONDS}s; answering without policy lookup")
+
+def search_index_batch(query_vectors, k, discipline=None):
+    """One n×d vector search; returns (distances, ids, partition) where partition is None for the global index."""
+    queries = np.array(query_vectors).astype("float32")
+    partition = discipline_partitions.get(discipline_key(discipline))
+    if partition is not None and len(partition["ids"]) >= max(k, DISCIPLINE_MIN_PARTITION):
+        D, I = faiss_index.search(queries, k, params=partition["params"])
+        if (I >= 0).all():
+            return D, I, partition
+    D, I = faiss_index.search(queries, k)
+    return D, I, None
+
+def search_index(query_vector, k, discipline=None):
+    D, I, partition = search_index_batch([query_vector], k, discipline)
+    return D[0], I[0], partition
+
+def rank_chunks_batch(query_texts, query_vectors, k, discipline=None, timer=None):
+    """Top-k chunk ids per query, fusing FAISS and BM25 rankings by reciprocal rank when BM25 is loaded."""
+    timer = timer or StageTimer(observe=False)
+    with timer.stage("search"):
+        D, I, partition = search_index_batch(query_vectors, max(HYBRID_CANDIDATES, k) if bm25_index else k, discipline)
+    ranked = [[int(i) for i in row if i >= 0] for row in I]
+    if bm25_index is None:
+        return [ids[:k] for ids in ranked]
+
+    with timer.stage("lexical"):
+        mask = partition["mask"] if partition else None
+        return [
+            reciprocal_rank_fusion([ids, bm25_index.search(text, max(HYBRID_CANDIDATES, k), mask)])[:k]
+            for text, ids in zip(query_texts, ranked)
+        ]
+
+def rank_chunks(query_text, query_vector, k, discipline=None, timer=None):
+    return rank_chunks_batch([query_text], [query_vector], k, discipline, timer)[0]
+
+def read_chunk(i):
+    if chunk_store is not None:
+        return chunk_store[i]
+    with open(f"data/{metadata[i]['chunk_file']}", "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+def build_prompt(data, context):
     query = data.get("query", "")
     job_title = data.get("job_title", "Not specified")
     rank_level = data.get("rank_level", "Not specified")
@@ -151,30 +471,157 @@ Please generate a structured response that includes:
 2. **Action Sheet** – bullet-point steps the enquirer should follow.
 3. **Policy Notes** – cite any relevant UK policing policies, SOPs, or legal codes.
 """
-    return generate_reviewed_response(prompt,discipline)
-
-def generate_reviewed_response(prompt,discipline,):
-    print("📢 Sending initial GPT prompt...")
-
-    completion = client.chat.completions.create(
+    return prompt
+
+# Discipline-specific tone and structure. two_pass applies it in a rewrite of the draft;
+# single_pass and adaptive put it in the first prompt. The headings are what adaptive checks for.
+FIELD_OPERATIONS_GUIDANCE = textwrap.dedent("""\
+    You are acting as a UK operational police officer preparing an urgent briefing.
+
+    Priority Guidance:
+    - When answering queries about stop and search, prioritize using Section 1 of the Police and Criminal Evidence Act 1984 (PACE).
+    - Only refer to Policing and Crime Act 2017 Section 47C/47G if specifically about property seizure.
+    - Focus on tactical deployment actions: what the officer must DO and SAY.
+    - Keep answers clear, lawful, and officer operational.
+    - Write in short, direct sentences suitable for operational use.
+    - Avoid soft or cautious civilian phrasing.
+    - Emphasize lawful authority, officer safety, and public protection.
+
+    Rewrite the following draft as if it is a formal operational briefing being issued to a frontline deployment team. Use direct tactical orders. Replace soft suggestions with clear, lawful commands ("Establish", "Detain", "Secure", "Arrest", "Preserve evidence").
+
+    Use direct, command-style language. Avoid soft language ("thank you", "please", "ensure") and focus on clear tactical orders ("Establish", "Detain", "Secure", "Arrest", "Preserve evidence").
+
+    Structure using clear headings:
+       - LEGAL POWER
+       - PROCEDURE
+       - IMPORTANT NOTES
+       - SPECIAL CASES
+       - EXAMPLE WORDING TO USE WITH SUSPECTS
+       - EXAMPLE WORDING TO USE WITH PUBLIC
+    Avoid any civilian narrative tone. Focus on immediate deployment needs.
+    """)
+
+PROCEDURE_GUIDANCE = textwrap.dedent("""\
+    You are acting as a UK police Professional Standards Officer or Custody Sergeant.
+
+    Rewrite the following draft as formal, clear procedural guidance for frontline officers. Focus on correct application of UK law (PACE, Criminal Law Act, etc.), internal policies, and officer conduct.
+
+    Structure as:
+    - ISSUE SUMMARY
+    - APPLICABLE LAW
+    - PROCEDURAL GUIDANCE
+    - RISK NOTES
+
+    No command tone needed. Use neutral, professional legal explanation style.
+    """)
+
+GENERAL_GUIDANCE = "Please clean and improve the following structured response while maintaining professional tone and factual accuracy.\n"
+
+REVIEW_GUIDANCE = {
+    "Police Field Operations": (FIELD_OPERATIONS_GUIDANCE, ("LEGAL POWER", "PROCEDURE", "IMPORTANT NOTES", "SPECIAL CASES",
+                                                            "EXAMPLE WORDING TO USE WITH SUSPECTS", "EXAMPLE WORDING TO USE WITH PUBLIC")),
+    "Police Procedure": (PROCEDURE_GUIDANCE, ("ISSUE SUMMARY", "APPLICABLE LAW", "PROCEDURAL GUIDANCE", "RISK NOTES")),
+}
+DEFAULT_GUIDANCE = (GENERAL_GUIDANCE, ("Enquirer Reply", "Action Sheet", "Policy Notes"))
+
+def review_guidance(discipline):
+    """(instructions, required headings) for a discipline."""
+    return REVIEW_GUIDANCE.get(discipline, DEFAULT_GUIDANCE)
+
+# two_pass: draft then rewrite (skipped for drafts over 1500 characters)
+# single_pass: one call, with the discipline's structure and tone in the prompt
+# adaptive: single_pass prompt, rewrite only when the draft misses a required heading
+GENERATION_STRATEGIES = ("two_pass", "single_pass", "adaptive")
+GENERATION_STRATEGY = os.getenv("GENERATION_STRATEGY", "two_pass").lower()
+if GENERATION_STRATEGY not in GENERATION_STRATEGIES:
+    print(f"⚠️ Unknown GENERATION_STRATEGY {GENERATION_STRATEGY!r}; using two_pass")
+    GENERATION_STRATEGY = "two_pass"
+
+def build_single_pass_prompt(data, context):
+    instructions, headings = review_guidance(data.get("discipline", "Not specified"))
+    return build_prompt(data, context) + f"""
+### Style and Structure:
+There is no separate review step, so write the final version now. Apply the guidance below to your own response; where it mentions a draft, it means your response.
+Start each section with a '### ' heading line, using these headings in this order (they take the place of the sections listed under Your Task): {", ".join(headings)}.
+
+{instructions}"""
+
+def draft_prompt(data, context, strategy=None):
+    strategy = strategy or GENERATION_STRATEGY
+    return build_prompt(data, context) if strategy == "two_pass" else build_single_pass_prompt(data, context)
+
+def missing_headings(answer, headings):
+    return [
+        heading for heading in headings
+        if not re.search(rf"^[\s#*\d.)-]*{re.escape(heading)}\b", answer, flags=re.IGNORECASE | re.MULTILINE)
+    ]
+
+def review_decision(draft, discipline, strategy=None):
+    """(whether to run the review pass, why)."""
+    strategy = strategy or GENERATION_STRATEGY
+    if strategy == "single_pass":
+        return False, "single_pass"
+    if strategy == "adaptive":
+        missing = missing_headings(draft, review_guidance(discipline)[1])
+        return (True, "missing headings: " + ", ".join(missing)) if missing else (False, "all required headings present")
+    # ⛔ Skip review if too big
+    if len(draft) > 1500:
+        return False, "draft over 1500 characters"
+    return True, "two_pass"
+
+def call_record(pass_name, started, completion):
+    usage = getattr(completion, "usage", None)
+    latency = time.perf_counter() - started
+    STAGE_SECONDS.observe(latency, stage=pass_name)
+    record_usage(pass_name, usage)
+    return {
+        "pass": pass_name,
+        "latency_s": round(latency, 3),
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None)
+    }
+
+def chat_completion(prompt, pass_name, calls, **kwargs):
+    started = time.perf_counter()
+    completion = openai_client().chat.completions.create(
         model="gpt-4",
         messages=[{"role": "user", "content": prompt}],
         temperature=0,
-        max_tokens=1800  # Allow longer initial output
+        **kwargs
     )
-    initial_response = completion.choices[0].message.content.strip()
+    calls.append(call_record(pass_name, started, completion))
+    return completion.choices[0].message.content.strip()
 
-    # 📏 Initial GPT response length
-    print(f"📏 Initial GPT response length: {len(initial_response)} characters")
+def record_review(info):
+    # "missing headings: Risks" -> missing_headings, keeping the label set small
+    reason = info["review_reason"].split(":")[0].replace(" ", "_")
+    REVIEW_DECISIONS.inc(strategy=info["strategy"], decision="reviewed" if info["reviewed"] else "skipped", reason=reason)
 
-    # ⛔ Skip review if too big
-    if len(initial_response) > 1500:
-        print("⚡ Skipping review — using initial GPT response directly.")
-        return initial_response
+def generate_answer(data, context, strategy=None):
+    """Run the configured generation strategy; returns (answer, info) with the strategy and per-call latency."""
+    strategy = strategy or GENERATION_STRATEGY
+    discipline = data.get("discipline", "Not specified")
+    info = {"strategy": strategy, "calls": []}
+
+    print(f"📢 Sending initial GPT prompt ({strategy})...")
+    draft = chat_completion(draft_prompt(data, context, strategy), "draft", info["calls"], max_tokens=1800)
+    print(f"📏 Initial GPT response length: {len(draft)} characters")
+
+    info["reviewed"], info["review_reason"] = review_decision(draft, discipline, strategy)
+    record_review(info)
+    if not info["reviewed"]:
+        print(f"⚡ Skipping review — {info['review_reason']}.")
+        return draft, info
 
-    # 🔄 Otherwise review normally
-    print("🔄 Reviewing GPT response...")
+    print(f"🔄 Reviewing GPT response ({info['review_reason']})...")
+    # 🚀 Request GPT review with tight limits (trimmed to avoid Render crashes, capped to prevent long hangs)
+    reviewed = chat_completion(build_review_prompt(draft, discipline), "review", info["calls"], max_tokens=700, timeout=15)
+    print(f"✅ Reviewed response length: {len(reviewed)} characters")
+    return reviewed, info
 
+REVIEW_TOKEN_BUDGET = int(os.getenv("REVIEW_TOKEN_BUDGET", "500"))
+
+def build_review_prompt(initial_response, discipline):
     # 🧼 Strip polite sign-offs
     initial_response = re.sub(
         r'(Best regards,|Yours sincerely,|Kind regards,)[\s\S]*$',
@@ -185,82 +632,41 @@ def generate_reviewed_response(prompt,discipline,):
 
     # ✂️ Trim FAISS context and limit input length
     stripped_response = initial_response.split("### Context from FAISS Index:")[0].strip()
-    stripped_response = stripped_response[:2000]  # Safe upper limit
-
-    # 🧠 Build review prompt using textwrap.dedent
-    if discipline == "Police Field Operations":
-          review_prompt = textwrap.dedent(f"""\
-       You are acting as a UK operational police officer preparing an urgent briefing.
-       
-       Priority Guidance:
-       - When answering queries about stop and search, prioritize using Section 1 of the Police and Criminal Evidence Act 1984 (PACE).
-       - Only refer to Policing and Crime Act 2017 Section 47C/47G if specifically about property seizure.
-       - Focus on tactical deployment actions: what the officer must DO and SAY.
-       - Keep answers clear, lawful, and officer operational.
-       - Write in short, direct sentences suitable for operational use.
-       - Avoid soft or cautious civilian phrasing.
-       - Emphasize lawful authority, officer safety, and public protection.                                           
-       
-       Rewrite the following draft as if it is a formal operational briefing being issued to a frontline deployment team. Use direct tactical orders. Replace soft suggestions with clear, lawful commands ("Establish", "Detain", "Secure", "Arrest", "Preserve evidence").
-
-       Use direct, command-style language. Avoid soft language ("thank you", "please", "ensure") and focus on clear tactical orders ("Establish", "Detain", "Secure", "Arrest", "Preserve evidence").
-
-       Structure using clear headings:
-          - LEGAL POWER
-          - PROCEDURE
-          - IMPORTANT NOTES
-          - SPECIAL CASES
-          - EXAMPLE WORDING TO USE WITH SUSPECTS
-          - EXAMPLE WORDING TO USE WITH PUBLIC )              
-       Avoid any civilian narrative tone. Focus on immediate deployment needs.                         
-       --- START RESPONSE ---
-       {stripped_response}
-       --- END RESPONSE ---
-       """)
-    elif discipline == "Police Procedure":
-          review_prompt = textwrap.dedent(f"""\
-        You are acting as a UK police Professional Standards Officer or Custody Sergeant.
-
-        Rewrite the following draft as formal, clear procedural guidance for frontline officers. Focus on correct application of UK law (PACE, Criminal Law Act, etc.), internal policies, and officer conduct.
-
-        Structure as:
-        - ISSUE SUMMARY
-        - APPLICABLE LAW
-        - PROCEDURAL GUIDANCE
-        - RISK NOTES
-
-        No command tone needed. Use neutral, professional legal explanation style.
-
-        --- START RESPONSE ---
-        {stripped_response}
-        --- END RESPONSE ---
-        """)
-
-    else:
-        review_prompt = textwrap.dedent(f"""\
-        Please clean and improve the following structured response while maintaining professional tone and factual accuracy.
-
-        --- START RESPONSE ---
-        {stripped_response}
-        --- END RESPONSE ---
-        """)
-
-    # 🚀 Request GPT review with tight limits
-    review_completion = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": review_prompt}],
-        temperature=0,
-        max_tokens=700,  # Trimmed to avoid Render crashes
-        timeout=15        # Optional cap to prevent long hangs
-    )
-
-    reviewed_response = review_completion.choices[0].message.content.strip()
-    print(f"✅ Reviewed response length: {len(reviewed_response)} characters")
-    return reviewed_response
-
-def send_email_mailjet(to_emails, subject, body_text, attachments=[], full_name=None, supervisor_name=None):
-    MAILJET_API_KEY = os.getenv("MJ_APIKEY_PUBLIC")
-    MAILJET_SECRET_KEY = os.getenv("MJ_APIKEY_PRIVATE")
+    stripped_response = truncate_to_tokens(stripped_response, REVIEW_TOKEN_BUDGET)  # Safe upper limit
+
+    instructions, _ = review_guidance(discipline)
+    return f"{instructions}\n--- START RESPONSE ---\n{stripped_response}\n--- END RESPONSE ---\n"
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+def make_attachment(filename, content, content_type=DOCX_CONTENT_TYPE):
+    """Mailjet attachment dict; base64-encoded once and shared by every message."""
+    return {
+        "ContentType": content_type,
+        "Filename": filename,
+        "Base64Content": base64.b64encode(content).decode()
+    }
+
+mail_transport = None
+
+def mailer():
+    global mail_transport
+    if mail_transport is None:
+        from mail_transport import MailjetTransport
+        mail_transport = MailjetTransport.from_env()
+    return mail_transport
+
+def send_messages(messages):
+    return mailer().send(messages)
+
+def build_mailjet_messages(to_emails, subject, body_text, attachments=None, full_name=None, supervisor_name=None):
+    # Attachments are make_attachment() dicts, or file paths read and encoded here once
+    encoded_attachments = []
+    for attachment in attachments or []:
+        if not isinstance(attachment, dict):
+            with open(attachment, "rb") as f:
+                attachment = make_attachment(os.path.basename(attachment), f.read())
+        encoded_attachments.append(attachment)
 
     messages = []
 
@@ -296,279 +702,124 @@ This document was generated following a query submitted by {full_name}. Please f
             "Subject": subject,
             "TextPart": text_body,
             "HTMLPart": f"<pre>{text_body}</pre>",
-            "Attachments": [
-                {
-                    "ContentType": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    "Filename": os.path.basename(file_path),
-                    "Base64Content": base64.b64encode(open(file_path, "rb").read()).decode()
-                }
-                for file_path in attachments
-            ]
+            "Attachments": encoded_attachments
         })
+    return messages
+
+def send_email_mailjet(to_emails, subject, body_text, attachments=None, full_name=None, supervisor_name=None):
+    messages = build_mailjet_messages(to_emails, subject, body_text, attachments, full_name, supervisor_name)
+    status, response = send_messages(messages)
+
+    print(f"📤 Mailjet status: {status}")
+    print(response)
+    return status, response
+
+outbox_transport = None
+
+def send_outbox_messages(messages):
+    # One attempt per claim: the outbox retries with its own backoff, so a send
+    # never outlives the row's lease and a second sender cannot pick it up mid-send
+    global outbox_transport
+    if outbox_transport is None:
+        from mail_transport import MailjetTransport
+        outbox_transport = MailjetTransport.from_env(max_retries=0)
+        if outbox_transport.worst_case_seconds() >= mail_outbox.lease_seconds:
+            print(f"⚠️ Mailjet timeouts ({outbox_transport.worst_case_seconds():.0f}s) exceed the outbox lease "
+                  f"({mail_outbox.lease_seconds}s); raise MAIL_OUTBOX_LEASE_SECONDS")
+    return outbox_transport.send(messages)
+
+MAIL_OUTBOX_PATH = os.getenv("MAIL_OUTBOX_PATH")
+mail_outbox = MailOutbox(
+    MAIL_OUTBOX_PATH, send=send_outbox_messages,
+    lease_seconds=int(os.getenv("MAIL_OUTBOX_LEASE_SECONDS", "120")),
+    retention_seconds=int(float(os.getenv("MAIL_OUTBOX_RETENTION_DAYS", "7")) * 86400)
+) if MAIL_OUTBOX_PATH else None
+if mail_outbox:
+    mail_outbox.start()
+    print(f"📮 Mail outbox enabled: {MAIL_OUTBOX_PATH}")
+
+def build_recipients(data):
+    full_name = data.get("full_name", "User")
+    supervisor_name = data.get("supervisor_name", "Supervisor")
+    recipients = []
+    if data.get("user_email"):
+        recipients.append({"Email": data["user_email"], "Name": full_name})
+    if data.get("supervisor_email"):
+        recipients.append({"Email": data["supervisor_email"], "Name": supervisor_name})
+    if data.get("hr_email"):
+        recipients.append({"Email": data["hr_email"], "Name": "HR Department"})
+    return recipients
+
+def validate_payload(data):
+    if not isinstance(data, dict):
+        return "Invalid JSON input"
+    if not isinstance(data.get("query"), str) or not data["query"].strip():
+        return "A query is required."
+    if not build_recipients(data):
+        return "No valid email addresses provided."
+    return None
+
+# Context is packed into a token budget from the top CONTEXT_CANDIDATES hits
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1800"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "8"))
+NO_CONTEXT = "Policy lookup not available (FAISS index not loaded)."
+
+def retrieve_context(query_text, query_vector, timer, discipline=None):
+    """Returns (context, packing info with the tokens used)."""
+    return build_context(rank_chunks(query_text, query_vector, CONTEXT_CANDIDATES, discipline, timer), timer)
+
+def build_context(ids, timer):
+    with timer.stage("chunk_read"):
+        candidates = []
+        for i in ids:
+            text = read_chunk(i)
+            # Redact sensitive info (already done at pack time when the stamp matches)
+            if not context_pre_redacted:
+                text = redactor.redact(text)
+            entry = metadata[i]
+            candidates.append({"id": i, "text": text, "source_file": entry["source_file"], "chunk_number": entry["chunk_number"]})
+
+    with timer.stage("context_pack"):
+        context, packing = pack_context(candidates, CONTEXT_TOKEN_BUDGET)
+    print(f"🧩 Context: {len(packing['chunks'])}/{packing['candidates']} chunks, "
+          f"{packing['tokens']}/{packing['budget']} tokens ({packing['tokenizer']})")
+    return context, packing
+
+def clean_answer(answer):
+    # ✅ Remove repeated '### ORIGINAL QUERY' section if GPT included it
+    return re.sub(r"### ORIGINAL QUERY\s*[\r\n]+.*?(?=###|\Z)", "", answer, flags=re.IGNORECASE | re.DOTALL).strip()
 
-    response = requests.post(
-        "https://api.mailjet.com/v3.1/send",
-        auth=(MAILJET_API_KEY, MAILJET_SECRET_KEY),
-        json={"Messages": messages}
-    )
-
-    print(f"📤 Mailjet status: {response.status_code}")
-    print(response.json())
-    return response.status_code, response.json()
-
-@app.route("/generate", methods=["POST"])
-def generate_response():
-    print("📥 /generate route hit")
-    try:
-        data = request.get_json()
-        print("🔎 Payload received:", data)
-    except Exception as e:
-        print("❌ Error parsing JSON:", e)
-        return jsonify({"error": "Invalid JSON input"}), 400
+# 🗄️ Copies of sent reports, bounded in size and age (None with SAVE_REPORTS=0)
+report_storage = ReportStorage.from_env()
 
+def prepare_report(data, answer, timer):
+    """Render the Word report and return the send_email_mailjet() arguments for it."""
     query_text = data.get("query")
     full_name = data.get("full_name", "User")
-    user_email = data.get("user_email")
-    supervisor_email = data.get("supervisor_email")
-    hr_email = data.get("hr_email")
     supervisor_name = data.get("supervisor_name", "Supervisor")
     timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
-    if faiss_index:
-        query_vector = client.embeddings.create(
-            input=[query_text.replace("\n", " ")],
-            model="text-embedding-3-small"
-        ).data[0].embedding
-
-        D, I = faiss_index.search(np.array([query_vector]).astype("float32"), 2)
-
-        matched_chunks = []
-        for i in I[0]:
-            chunk_file = metadata[i]["chunk_file"]
-            with open(f"data/{chunk_file}", "r", encoding="utf-8") as f:
-                matched_chunks.append(f.read().strip())
-
-        context = "\n\n---\n\n".join(matched_chunks)
-
-        # Redact sensitive info
-        sensitive_names = ["Wiltshire Police", "Humberside Police", "Avon and Somerset Police"]
-        for name in sensitive_names:
-            context = context.replace(name, "the relevant police force")
-
-        context = re.sub(r'\b(PC|SGT|CID)?\d{3,5}\b', '[badge number]', context, flags=re.IGNORECASE)
-
-    else:
-        context = "Policy lookup not available (FAISS index not loaded)."
-
-    answer = ask_gpt_with_context(data, context)
-
-    # ✅ Remove repeated '### ORIGINAL QUERY' section if GPT included it
-    answer = re.sub(r"### ORIGINAL QUERY\s*[\r\n]+.*?(?=###|\Z)", "", answer, flags=re.IGNORECASE | re.DOTALL).strip()
-    
     print(f"🧠 GPT answer: {answer[:80]}...")
-    
-    discipline = data.get("discipline", "Not specified")
-    discipline_folder = discipline.lower().replace(" ", "_")
-    output_path = f"output/{discipline_folder}"
-    os.makedirs(output_path, exist_ok=True)
 
-    doc_path = f"{output_path}/{full_name.replace(' ', '_')}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.docx"
-    
-    doc = Document()
-
-    # ✅ Apply default document style
-    doc.styles['Normal'].font.name = 'Arial'
-    doc.styles['Normal'].font.size = Pt(11)
-    doc.styles['Normal'].font.color.rgb = RGBColor(0, 0, 0)
-
-    # Document styling
-    section = doc.sections[0]
-    section.page_height = Mm(297)
-    section.page_width = Mm(210)
-
-    title_para = doc.add_paragraph()
-    title_run = title_para.add_run(f"RESPONSE FOR {full_name.upper()}")
-    title_run.bold = True
-    title_run.font.name = 'Arial'
-    title_run.font.size = Pt(14)
-    title_run.font.color.rgb = RGBColor(0, 0, 0)
-    
-    # ✅ UK-style timestamp
-    uk_time = datetime.now(ZoneInfo("Europe/London"))
-    generated_datetime = uk_time.strftime("%d %B %Y at %H:%M:%S (%Z)")
-    doc.add_paragraph(f"Generated: {generated_datetime}")
-
-    # 🔹 ORIGINAL QUERY heading
-    para_query_heading = doc.add_paragraph()
-    run_heading = para_query_heading.add_run("ORIGINAL QUERY")
-    run_heading.bold = True
-    run_heading.font.name = 'Arial'
-    run_heading.font.size = Pt(11)
-    run_heading.font.color.rgb = RGBColor(0, 0, 0)
-
-    # 🔹 Divider ABOVE the query text
-    divider_above = doc.add_paragraph()
-    divider_above_run = divider_above.add_run("────────────────────────────────────────────")
-    divider_above_run.font.name = 'Arial'
-    divider_above_run.font.size = Pt(10)
-    divider_above_run.font.color.rgb = RGBColor(0, 0, 0)
-
-    # 🔹 Italicised query
-    para_query_text = doc.add_paragraph()
-    run_query = para_query_text.add_run(f'"{query_text.strip()}"')
-    run_query.italic = True
-    run_query.font.name = 'Arial'
-    run_query.font.size = Pt(11)
-    run_query.font.color.rgb = RGBColor(0, 0, 0)
-
-    # 🔹 Divider BELOW the query text
-    divider_below = doc.add_paragraph()
-    divider_below_run = divider_below.add_run("────────────────────────────────────────────")
-    divider_below_run.font.name = 'Arial'
-    divider_below_run.font.size = Pt(10)
-    divider_below_run.font.color.rgb = RGBColor(0, 0, 0)
-
-    # ✅ Bold header: "AI RESPONSE"
-    para1 = doc.add_paragraph()
-    run1 = para1.add_run("AI RESPONSE")
-    run1.bold = True
-    run1.font.name = 'Arial'
-    run1.font.size = Pt(11)
-    run1.font.color.rgb = RGBColor(0, 0, 0)
-
-    # ✅ Subheader: "Note: ..."
-    para2 = doc.add_paragraph()
-    run2 = para2.add_run("Note: This report was prepared using AI analysis based on the submitted query.")
-    run2.bold = True
-    run2.font.name = 'Arial'
-    run2.font.size = Pt(11)
-    run2.font.color.rgb = RGBColor(0, 0, 0)
-
-    # ✅ ORIGINAL QUERY label✅ ORIGINAL QUERY label
-    # ✅ ORIGINAL QUERY labelpara3 = doc.add_paragraph()
-    # ✅ ORIGINAL QUERY labelrun3 = para3.add_run("ORIGINAL QUERY:\n")
-    # ✅ ORIGINAL QUERY labelrun3.bold = True
-    # ✅ ORIGINAL QUERY labelrun3.font.name = 'Arial'
-    # ✅ ORIGINAL QUERY labelrun3.font.size = Pt(11)
-    # ✅ ORIGINAL QUERY labelrun3.font.color.rgb = RGBColor(0, 0, 0)
- #
-    # 🔹 ORIGINAL QUERY heading
-    #para_query_heading = doc.add_paragraph()
-    #run_heading = para_query_heading.add_run("ORIGINAL QUERY")
-    #run_heading.bold = True
-    #run_heading.font.name = 'Arial'
-    #run_heading.font.size = Pt(11)
-    #run_heading.font.color.rgb = RGBColor(0, 0, 0)
-
-    # 🔹 Divider ABOVE the query text
-    # divider_above = doc.add_paragraph()
-     #divider_above_run = divider_above.add_run("────────────────────────────────────────────")
-     #divider_above_run.font.name = 'Arial'
-     #divider_above_run.font.size = Pt(10)
-     #divider_above_run.font.color.rgb = RGBColor(0, 0, 0)
-
-    # 🔹 Italicised query
-    #para_query_text = doc.add_paragraph()
-    #run_query = para_query_text.add_run(f'"{query_text.strip()}"')
-    #run_query.italic = True
-    #run_query.font.name = 'Arial'
-    #run_query.font.size = Pt(11)
-    #run_query.font.color.rgb = RGBColor(0, 0, 0)
-
-    # 🔹 Divider BELOW the query text
-    divider_below = doc.add_paragraph()
-    divider_below_run = divider_below.add_run("────────────────────────────────────────────")
-    divider_below_run.font.name = 'Arial'
-    divider_below_run.font.size = Pt(10)
-    divider_below_run.font.color.rgb = RGBColor(0, 0, 0)
-    # ✅ Actual query content
-    #doc.add_paragraph(query_text.strip())
-
-    #divider = doc.add_paragraph()
-    #divider.add_run("────────────────────────────────────────────").font.size = Pt(10)
-
-    # Split answer into structured sections
-    sections = re.split(r'^### (.*?)\n', answer, flags=re.MULTILINE)
-    structured = {}
-    current_title = None
-
-    for i, part in enumerate(sections):
-        content = part.strip()
-        if i == 0 and content:
-            content = re.sub(r'^\s*Enquirer Reply\s*', '', content, flags=re.IGNORECASE)
-            content = re.sub(r'^\s*Hello,\s*', '', content, flags=re.IGNORECASE)
-            structured["Enquirer Reply"] = content
-        elif i % 2 == 1:
-            current_title = content
-        elif i % 2 == 0 and current_title:
-            if current_title.lower() in ["enquirer reply", "initial response"]:
-                lines = content.splitlines()
-                cleaned_lines = [line for line in lines if not re.match(r'^\s*(enquirer reply|hello,?)\s*$', line, flags=re.IGNORECASE)]
-                content = "\n".join(cleaned_lines).strip()
-            structured[current_title] = content
-            # ✅ Added debug line here 16 38
-            print("🔍 Structured keys:", list(structured.keys()))
-
-    if not structured:
-        print("⚠️ GPT returned unstructured content. Using entire answer as 'Initial Response'.")
-        structured["Initial Response"] = answer.strip()
-
-    rename = {"Enquirer Reply": "Initial Response"}
-    for title in structured:
-        heading = doc.add_paragraph()
-        heading_run = heading.add_run(rename.get(title, title).upper())
-        heading_run.bold = True
-        heading_run.font.name = 'Arial'
-        heading_run.font.size = Pt(12)
-        heading_run.font.color.rgb = RGBColor(0, 0, 0)
-
-        if title in ["Action Sheet", "Policy Notes"]:
-           lines = structured[title].splitlines()
-           for line in lines:
-              clean = line.strip()
-              clean = re.sub(r'^[-•–]?\s*\d+[.)]?\s*', '', clean)
-              clean = re.sub(r'^[-•–]\s*', '', clean)
-              if clean:
-                  para = doc.add_paragraph(clean, style='List Number')
-                  para.paragraph_format.left_indent = Mm(5) 
-
-         #elif title == "Policy Notes":
-            #lines = structured[title].splitlines()
-            #for line in lines:
-               #clean = line.strip()
-               #clean = re.sub(r'^[-•–]?\s*\d+[.)]?\s*', '', clean)
-               #clean = re.sub(r'^[-•–]\s*', '', clean)
-               #if clean:
-                   #para = doc.add_paragraph(clean, style='List Number')
-                   #para.paragraph_format.left_indent = Mm(5)         
-        else:
-            # Default fallback for all other sections
-            cleaned_text = re.sub(r'\*\*(.*?)\*\*', r'\1', structured[title])
-            para = doc.add_paragraph()
-            run = para.add_run(cleaned_text)
-            run.font.name = 'Arial'
-            run.font.size = Pt(11)
-            run.font.color.rgb = RGBColor(0, 0, 0)
-
-    doc.add_paragraph()
-    doc.add_paragraph("────────────────────────────────────────────")
-    doc.add_paragraph("This document was generated by AIVS Software Limited using AI assistance (OpenAI). Please review for accuracy and relevance before taking any formal action.")
-    doc.add_paragraph("© AIVS Software Limited 2025. All rights reserved.")
-    doc.add_paragraph(datetime.now(ZoneInfo("Europe/London")).strftime("Report generated on %d %B %Y at %H:%M:%S (%Z)"))
-
-    doc.save(doc_path)
-    print(f"📄 Word saved: {doc_path}")
-
-    recipients = []
-    if user_email:
-        recipients.append({"Email": user_email, "Name": full_name})
-    if supervisor_email:
-        recipients.append({"Email": supervisor_email, "Name": supervisor_name})
-    if hr_email:
-        recipients.append({"Email": hr_email, "Name": "HR Department"})
-
-    if not recipients:
-        return jsonify({"error": "No valid email addresses provided."}), 400
+    filename = f"{full_name.replace(' ', '_')}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.docx"
+
+    # 📄 Render into memory and encode once for all recipients
+    from report_renderer import render_report
+    with timer.stage("docx"):
+        buffer = io.BytesIO()
+        render_report(buffer, full_name, query_text, answer)
+        content = buffer.getvalue()
+        attachment = make_attachment(filename, content)
+
+    if report_storage:
+        # A full or read-only disk must not stop the report being sent
+        try:
+            with timer.stage("report_store"):
+                stored = report_storage.save(content, filename, data.get("discipline", "Not specified"),
+                                             digest=report_fingerprint(full_name, query_text, answer))
+            print(f"📄 Word saved: {stored['path']}" + (" (already stored)" if stored["deduplicated"] else ""))
+        except OSError as e:
+            print("⚠️ Report not saved:", str(e))
 
     subject = f"AI Analysis for {full_name} - {timestamp}"
     body_text = f"""To: {full_name},
@@ -576,24 +827,452 @@ def generate_response():
 Please find attached the AI-generated analysis based on your query submitted on {timestamp}.
 """
 
-    status, response = send_email_mailjet(
-        to_emails=recipients,
+    mail = dict(
+        to_emails=build_recipients(data),
         subject=subject,
         body_text=body_text,
-        attachments=[doc_path],
+        attachments=[attachment],
         full_name=full_name,
         supervisor_name=supervisor_name
     )
+    return mail
 
-    return jsonify({
+def enqueue_report(data, mail, timer):
+    with timer.stage("outbox"):
+        key = mail_outbox.enqueue(build_mailjet_messages(**mail), key=data.get("idempotency_key"))
+    print(f"📮 Report queued in outbox: {key}")
+    return "queued", {"outbox_id": key, "status_url": f"/outbox/{key}"}
+
+def deliver_report(data, answer, timer):
+    mail = prepare_report(data, answer, timer)
+
+    # 📮 With an outbox, the request is done once the report is committed to it
+    if mail_outbox:
+        return enqueue_report(data, mail, timer)
+
+    with timer.stage("mail"):
+        status, response = send_email_mailjet(**mail)
+
+    return status, response
+
+def run_generate(data, timer):
+    query_text = data.get("query")
+    wait_for_indexes()
+
+    cached = None
+    generation = packing = None
+    if faiss_index:
+        with timer.stage("embedding"):
+            query_vector = embed_query(query_text)
+        with timer.stage("answer_cache"):
+            cached = answer_cache.lookup(query_vector, data.get("discipline"), data.get("rank_level"))
+
+    if cached:
+        print(f"♻️ Answer cache hit (similarity {cached['similarity']:.3f}): {cached['query'][:60]}")
+        context = cached["context"]
+        answer = cached["answer"]
+    else:
+        context, packing = retrieve_context(query_text, query_vector, timer, data.get("discipline")) if faiss_index else (NO_CONTEXT, None)
+
+        with timer.stage("generation"):
+            answer, generation = generate_answer(data, context)
+
+        answer = clean_answer(answer)
+
+        if faiss_index:
+            answer_cache.store(query_vector, data.get("discipline"), data.get("rank_level"), query_text, answer, context)
+    
+    status, response = deliver_report(data, answer, timer)
+    return generate_result(context, answer, cached, status, response, generation, packing)
+
+def record_answer(cached, packing):
+    ANSWER_CACHE_RESULTS.inc(result="hit" if cached else "miss")
+    if packing:
+        CONTEXT_TOKENS.observe(packing["tokens"])
+
+def generate_result(context, answer, cached, status, response, generation=None, packing=None):
+    # Every /generate (sync, job or async) ends here, so its outcome is counted once here
+    record_answer(cached, packing)
+    MAIL_RESULTS.inc(status=status)
+    return {
         "status": "ok",
-        "message": "✅ OpenAI-powered response generated, AI reviewed and email successfully sent.",
+        "message": "✅ OpenAI-powered response generated, AI reviewed and email " + ("queued for delivery." if status == "queued" else "successfully sent."),
         "disclaimer": "This document was generated by AIVS Software Limited using AI assistance (OpenAI). Please review for accuracy and relevance before taking any formal action.",
         "copyright": "© AIVS Software Limited 2025. All rights reserved.",
         "context_preview": context[:200],
+        "context_tokens": packing,
+        "answer_cache": "hit" if cached else "miss",
+        "generation": generation,
         "mailjet_status": status,
         "mailjet_response": response
+    }
+
+def _job_store():
+    # Finished jobs are kept for JOB_TTL_HOURS, and at most JOB_MAX_FINISHED of them
+    path = os.getenv("JOB_STORE_PATH")
+    if not path and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        # A poll can land on any worker, so the jobs must live in a file they all share
+        import tempfile
+        path = os.path.join(tempfile.gettempdir(), "aivs_jobs.sqlite3")
+        print(f"🧾 Several workers and no JOB_STORE_PATH: jobs shared through {path}")
+    retention = dict(ttl=int(float(os.getenv("JOB_TTL_HOURS", "24")) * 3600),
+                     max_finished=int(os.getenv("JOB_MAX_FINISHED", "1000")))
+    return SQLiteJobStore(path, **retention) if path else MemoryJobStore(**retention)
+
+job_runner = JobRunner(run_generate, store=_job_store(), max_workers=int(os.getenv("JOB_WORKERS", "2")))
+
+def _deliver_streamed(payload, timer):
+    status, response = deliver_report(payload["data"], payload["answer"], timer)
+    MAIL_RESULTS.inc(status=status)
+    return {"status": "ok", "mailjet_status": status, "mailjet_response": response}
+
+report_runner = JobRunner(_deliver_streamed, store=job_runner.store, max_workers=int(os.getenv("JOB_WORKERS", "2")))
+
+def wants_async(data, env_default=True):
+    # GENERATE_ASYNC only sets the default for /generate; other routes go async when asked to
+    default = os.getenv("GENERATE_ASYNC", "0") if env_default else "0"
+    flag = request.args.get("async", data.get("async", default))
+    return str(flag).lower() in ("1", "true", "yes")
+
+@app.route("/generate", methods=["POST"])
+def generate_response():
+    print("📥 /generate route hit")
+    try:
+        data = request.get_json()
+        print("🔎 Payload received:", data)
+    except Exception as e:
+        print("❌ Error parsing JSON:", e)
+        return jsonify({"error": "Invalid JSON input"}), 400
+
+    error = validate_payload(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    if wants_async(data):
+        job_id = job_runner.submit(data)
+        print(f"🧾 Queued job {job_id}")
+        return jsonify({"status": "queued", "job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+    timer = StageTimer()
+    result = run_generate(data, timer)
+    result["timings"] = timer.as_dict()
+    return jsonify(result)
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    result = job.get("result") or {}
+    return jsonify({
+        "job_id": job["id"],
+        "status": job["status"],
+        "created": job.get("created"),
+        "started": job.get("started"),
+        "finished": job.get("finished"),
+        "timings": job.get("timings"),
+        "mailjet_status": result.get("mailjet_status"),
+        "result": result or None,
+        "error": job.get("error")
     })
+
+@app.route("/jobs/<job_id>/archive", methods=["GET"])
+def job_archive(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    name = (job.get("result") or {}).get("archive")
+    if not name:
+        return jsonify({"error": "No archive for this job (yet)", "status": job["status"]}), 404
+    path = os.path.join(batch_archive_dir(), os.path.basename(name))
+    if not os.path.exists(path):
+        return jsonify({"error": "Archive expired"}), 410
+    return send_file(path, mimetype="application/zip", as_attachment=True, download_name=name)
+
+@app.route("/outbox/<key>", methods=["GET"])
+def outbox_status(key):
+    entry = mail_outbox.get(key) if mail_outbox else None
+    if entry is None:
+        return jsonify({"error": "Unknown outbox id"}), 404
+    return jsonify(entry)
+
+@app.route("/generate/stream", methods=["POST"])
+def generate_stream():
+    print("📥 /generate/stream route hit")
+    try:
+        data = request.get_json()
+    except Exception as e:
+        print("❌ Error parsing JSON:", e)
+        return jsonify({"error": "Invalid JSON input"}), 400
+
+    error = validate_payload(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    def events():
+        timer = StageTimer()
+        query_text = data.get("query")
+        parser = SectionStreamParser()
+
+        try:
+            wait_for_indexes()
+            cached = packing = None
+            if faiss_index:
+                with timer.stage("embedding"):
+                    query_vector = embed_query(query_text)
+                with timer.stage("answer_cache"):
+                    cached = answer_cache.lookup(query_vector, data.get("discipline"), data.get("rank_level"))
+
+            if cached:
+                print(f"♻️ Answer cache hit (similarity {cached['similarity']:.3f}): {cached['query'][:60]}")
+                context = cached["context"]
+                for event, payload in parser.feed(cached["answer"]) + parser.close():
+                    yield sse(event, payload)
+            else:
+                context, packing = retrieve_context(query_text, query_vector, timer, data.get("discipline")) if faiss_index else (NO_CONTEXT, None)
+                yield sse("status", {"stage": "generating"})
+
+                # 📡 Stream the draft as it is written; the review pass is skipped here
+                with timer.stage("generation"):
+                    stream = openai_client().chat.completions.create(
+                        model="gpt-4",
+                        messages=[{"role": "user", "content": draft_prompt(data, context)}],
+                        temperature=0,
+                        max_tokens=1800,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+                    for chunk in stream:
+                        # The final chunk carries usage and no choices
+                        if getattr(chunk, "usage", None):
+                            record_usage("draft", chunk.usage)
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            for event, payload in parser.feed(delta):
+                                yield sse(event, payload)
+                    for event, payload in parser.close():
+                        yield sse(event, payload)
+
+            # Unreviewed drafts are not stored in the answer cache
+            answer = clean_answer(parser.answer)
+            record_answer(cached, packing)
+        except Exception as e:
+            print("❌ Streaming failed:", str(e))
+            yield sse("error", {"error": str(e)})
+            return
+
+        # 📄 Word report and email run after the stream has closed
+        job_id = report_runner.submit({"data": data, "answer": answer})
+        yield sse("done", {
+            "answer_cache": "hit" if cached else "miss",
+            "strategy": GENERATION_STRATEGY,
+            "context_tokens": packing,
+            "timings": timer.as_dict(),
+            "report_job_id": job_id,
+            "status_url": f"/jobs/{job_id}"
+        })
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# 📚 Batch enquiries: one embeddings request and one n×d FAISS search per discipline for the
+# whole batch, then GPT calls (and report delivery) for at most BATCH_CONCURRENCY items at a time
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_DELIVERIES = ("zip", "email")
+# Zips from asynchronous batches, downloaded from /jobs/<id>/archive and kept as long as the jobs
+BATCH_ARCHIVE_DIR = os.getenv("BATCH_ARCHIVE_DIR")
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch-item")
+
+def batch_items(data, delivery):
+    """Each enquiry merged over the shared fields; returns (items, error)."""
+    if not isinstance(data.get("items"), list) or not data["items"]:
+        return None, "items must be a non-empty list of enquiries."
+    if len(data["items"]) > BATCH_MAX_ITEMS:
+        return None, f"A batch holds at most {BATCH_MAX_ITEMS} enquiries."
+
+    shared = {k: v for k, v in data.items() if k not in ("items", "delivery", "async")}
+    items = []
+    for n, entry in enumerate(data["items"], 1):
+        item = dict(shared, **(entry if isinstance(entry, dict) else {"query": entry}))
+        # A batch-level idempotency key becomes one outbox key per item
+        if shared.get("idempotency_key") and not (isinstance(entry, dict) and entry.get("idempotency_key")):
+            item["idempotency_key"] = f"{shared['idempotency_key']}-{n}"
+        error = validate_payload(item) if delivery == "email" else None
+        if not isinstance(item.get("query"), str) or not item["query"].strip():
+            error = "A query is required."
+        if error:
+            return None, f"Item {n}: {error}"
+        items.append(item)
+    return items, None
+
+def batch_filename(n, query):
+    return f"{n:03d}_{re.sub(r'[^A-Za-z0-9]+', '_', query[:40]).strip('_') or 'enquiry'}.docx"
+
+def run_batch(items, delivery, timer):
+    """Answer every item; returns (per-item summaries, [(filename, docx bytes)] for zip delivery)."""
+    wait_for_indexes()
+    count = len(items)
+    cached, contexts, packings = [None] * count, [NO_CONTEXT] * count, [None] * count
+
+    if faiss_index:
+        with timer.stage("embedding"):
+            vectors = embed_queries([item["query"] for item in items])
+        with timer.stage("answer_cache"):
+            cached = [answer_cache.lookup(v, item.get("discipline"), item.get("rank_level")) for v, item in zip(vectors, items)]
+
+        groups = {}
+        for i, item in enumerate(items):
+            if cached[i]:
+                contexts[i] = cached[i]["context"]
+            else:
+                groups.setdefault(item.get("discipline"), []).append(i)
+        for discipline, members in groups.items():
+            ranked = rank_chunks_batch([items[i]["query"] for i in members], [vectors[i] for i in members],
+                                       CONTEXT_CANDIDATES, discipline, timer)
+            for i, ids in zip(members, ranked):
+                contexts[i], packings[i] = build_context(ids, timer)
+
+    def answer_item(i):
+        item, item_timer = items[i], StageTimer()
+        summary = {"item": i + 1, "query": item["query"], "answer_cache": "hit" if cached[i] else "miss",
+                   "context_tokens": packings[i]["tokens"] if packings[i] else None}
+        try:
+            if cached[i]:
+                answer = cached[i]["answer"]
+            else:
+                with item_timer.stage("generation"):
+                    answer, summary["generation"] = generate_answer(item, contexts[i])
+                answer = clean_answer(answer)
+                if faiss_index:
+                    answer_cache.store(vectors[i], item.get("discipline"), item.get("rank_level"), item["query"], answer, contexts[i])
+            record_answer(cached[i], packings[i])
+
+            document = None
+            if delivery == "email":
+                summary["mailjet_status"], summary["mailjet_response"] = deliver_report(item, answer, item_timer)
+                MAIL_RESULTS.inc(status=summary["mailjet_status"])
+            else:
+                from report_renderer import render_report
+                with item_timer.stage("docx"):
+                    buffer = io.BytesIO()
+                    render_report(buffer, item.get("full_name", "User"), item["query"], answer)
+                document = (batch_filename(i + 1, item["query"]), buffer.getvalue())
+                summary["file"] = document[0]
+            summary["status"] = "ok"
+        except Exception as e:
+            print(f"❌ Batch item {i + 1} failed:", str(e))
+            summary.update(status="error", error=str(e))
+            document = None
+        summary["timings"] = item_timer.as_dict()
+        return summary, document
+
+    with timer.stage("batch_items"):
+        results = list(batch_pool.map(answer_item, range(count)))
+    print(f"📚 Batch of {count}: {sum(s['status'] == 'ok' for s, _ in results)} answered, "
+          f"{sum(bool(c) for c in cached)} from the answer cache")
+    return [summary for summary, _ in results], [document for _, document in results if document]
+
+def batch_archive(summaries, documents, timer):
+    with timer.stage("zip"):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            # .docx files are already deflated
+            for filename, content in documents:
+                archive.writestr(filename, content, compress_type=zipfile.ZIP_STORED)
+            archive.writestr("manifest.json", json.dumps({"items": summaries, "timings": timer.as_dict()}, indent=2),
+                             compress_type=zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+def save_batch_archive(archive):
+    """Write an asynchronous batch's zip to BATCH_ARCHIVE_DIR; returns its file name."""
+    import uuid
+    root = batch_archive_dir()
+    os.makedirs(root, exist_ok=True)
+    ttl = getattr(job_runner.store, "ttl", None)
+    for name in os.listdir(root) if ttl else []:
+        path = os.path.join(root, name)
+        try:
+            if time.time() - os.path.getmtime(path) > ttl:
+                os.remove(path)
+        except OSError:
+            pass  # removed by another worker
+    name = f"aivs_batch_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.zip"
+    tmp_path = os.path.join(root, f".{name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(archive)
+    os.replace(tmp_path, os.path.join(root, name))
+    return name
+
+def batch_archive_dir():
+    import tempfile
+    return BATCH_ARCHIVE_DIR or os.path.join(tempfile.gettempdir(), "aivs_batches")
+
+def _batch_job(payload, timer):
+    delivery = payload.get("delivery", "email")
+    summaries, documents = run_batch(payload["items"], delivery, timer)
+    result = {"status": "ok", "items": summaries, "errors": sum(summary["status"] != "ok" for summary in summaries)}
+    if delivery == "zip":
+        result["archive"] = save_batch_archive(batch_archive(summaries, documents, timer))
+    return result
+
+batch_runner = JobRunner(_batch_job, store=job_runner.store, max_workers=1)
+
+@app.route("/generate/batch", methods=["POST"])
+def generate_batch():
+    print("📥 /generate/batch route hit")
+    try:
+        data = request.get_json()
+    except Exception as e:
+        print("❌ Error parsing JSON:", e)
+        return jsonify({"error": "Invalid JSON input"}), 400
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid JSON input"}), 400
+
+    # zip: one Word report per enquiry, returned as a zip; email: each report emailed as /generate does
+    delivery = str(data.get("delivery", "zip")).lower()
+    if delivery not in BATCH_DELIVERIES:
+        return jsonify({"error": f"delivery must be one of: {', '.join(BATCH_DELIVERIES)}"}), 400
+    items, error = batch_items(data, delivery)
+    if error:
+        return jsonify({"error": error}), 400
+
+    # Only an explicit async runs a batch as a job; a zip batch's archive is then fetched from /jobs/<id>/archive
+    if wants_async(data, env_default=False):
+        job_id = batch_runner.submit({"items": items, "delivery": delivery})
+        print(f"🧾 Queued batch job {job_id} ({len(items)} enquiries, {delivery})")
+        queued = {"status": "queued", "job_id": job_id, "items": len(items), "status_url": f"/jobs/{job_id}"}
+        if delivery == "zip":
+            queued["archive_url"] = f"/jobs/{job_id}/archive"
+        return jsonify(queued), 202
+
+    timer = StageTimer()
+    summaries, documents = run_batch(items, delivery, timer)
+    errors = sum(summary["status"] != "ok" for summary in summaries)
+    if delivery == "email":
+        return jsonify({"status": "ok", "items": summaries, "errors": errors, "timings": timer.as_dict()})
+
+    archive = batch_archive(summaries, documents, timer)
+    filename = f"aivs_batch_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip"
+    return Response(archive, mimetype="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Batch-Items": str(len(summaries)),
+        "X-Batch-Errors": str(errors)
+    })
+
+# INDEX_LOAD: background (default), sync (during import, e.g. before a preload fork)
+# or manual (the caller runs load_and_warm_up(), as bench/import_budget.py does)
+INDEX_LOAD = os.getenv("INDEX_LOAD", "background").lower()
+if INDEX_LOAD == "sync":
+    load_and_warm_up()
+elif INDEX_LOAD != "manual":
+    threading.Thread(target=load_and_warm_up, name="index-loader", daemon=True).start()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))
     app.run(host="0.0.0.0", port=port)
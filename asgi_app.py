@@ -0,0 +1,316 @@
+"""
+===============================================================
+ AIVS API — async entrypoint (ASGI)
+===============================================================
+ Serves /generate on an event loop so one worker can hold many
+ enquiries at once while they wait on OpenAI and Mailjet:
+
+   • AsyncOpenAI for the embedding, draft and review calls
+     (same GENERATION_STRATEGY as api.py)
+   • AsyncMailjetTransport (httpx) for the email send
+   • FAISS / BM25 search and docx rendering run on a small
+     thread pool (ASYNC_THREADS) so they never block the loop
+   • at most ASYNC_MAX_INFLIGHT enquiries run the pipeline at
+     once; the rest wait on a semaphore
+
+ Every other route (/jobs, /generate/stream, /stats, ...) is the
+ Flask app from api.py, run through a WSGI bridge (one thread per
+ request that streams the body back to the loop).
+
+ Run:  gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:10000
+===============================================================
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from openai import AsyncOpenAI
+
+import api
+from embedding_cache import embedding_input
+from mail_transport import AsyncMailjetTransport
+from timing import StageTimer
+
+aclient = AsyncOpenAI(api_key=api.OPENAI_API_KEY)
+async_mail = AsyncMailjetTransport.from_env()
+
+ASYNC_MAX_INFLIGHT = int(os.getenv("ASYNC_MAX_INFLIGHT", "32"))
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("ASYNC_THREADS", "4")), thread_name_prefix="asgi-cpu")
+_inflight = None
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"https://www.aivs.uk"),
+    (b"access-control-allow-headers", b"Content-Type"),
+    (b"access-control-allow-methods", b"POST, OPTIONS"),
+]
+
+
+def _semaphore():
+    # Created on first use so it binds to the server's running loop
+    global _inflight
+    if _inflight is None:
+        _inflight = asyncio.Semaphore(ASYNC_MAX_INFLIGHT)
+    return _inflight
+
+
+async def run_sync(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_pool, fn, *args)
+
+
+async def embed_query(text):
+    vector = api.embedding_cache.get(text, api.embedding_cache_model())
+    if vector is None:
+        response = await aclient.embeddings.create(input=[embedding_input(text)], model=api.EMBEDDING_MODEL,
+                                                   **api.embedding_options())
+        api.record_usage("embedding", getattr(response, "usage", None))
+        vector = response.data[0].embedding
+        api.embedding_cache.put(text, api.embedding_cache_model(), vector)
+    return vector
+
+
+async def chat_completion(prompt, pass_name, calls, **kwargs):
+    started = time.perf_counter()
+    completion = await aclient.chat.completions.create(
+        model="gpt-4",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0,
+        **kwargs
+    )
+    calls.append(api.call_record(pass_name, started, completion))
+    return completion.choices[0].message.content.strip()
+
+
+async def generate_answer(data, context):
+    """api.generate_answer with the OpenAI calls awaited."""
+    discipline = data.get("discipline", "Not specified")
+    info = {"strategy": api.GENERATION_STRATEGY, "calls": []}
+
+    draft = await chat_completion(api.draft_prompt(data, context), "draft", info["calls"], max_tokens=1800)
+    print(f"📏 Initial GPT response length: {len(draft)} characters")
+
+    info["reviewed"], info["review_reason"] = api.review_decision(draft, discipline)
+    api.record_review(info)
+    if not info["reviewed"]:
+        print(f"⚡ Skipping review — {info['review_reason']}.")
+        return draft, info
+
+    reviewed = await chat_completion(api.build_review_prompt(draft, discipline), "review", info["calls"], max_tokens=700, timeout=15)
+    print(f"✅ Reviewed response length: {len(reviewed)} characters")
+    return reviewed, info
+
+
+async def run_generate(data, timer):
+    """api.run_generate with the network calls awaited and the CPU work on the thread pool."""
+    query_text = data.get("query")
+    discipline = data.get("discipline")
+
+    if not api.indexes_ready.is_set():
+        await asyncio.get_running_loop().run_in_executor(None, api.wait_for_indexes)
+
+    cached = None
+    generation = packing = None
+    if api.faiss_index:
+        with timer.stage("embedding"):
+            query_vector = await embed_query(query_text)
+        with timer.stage("answer_cache"):
+            cached = await run_sync(api.answer_cache.lookup, query_vector, discipline, data.get("rank_level"))
+
+    if cached:
+        print(f"♻️ Answer cache hit (similarity {cached['similarity']:.3f}): {cached['query'][:60]}")
+        context = cached["context"]
+        answer = cached["answer"]
+    else:
+        if api.faiss_index:
+            context, packing = await run_sync(api.retrieve_context, query_text, query_vector, timer, discipline)
+        else:
+            context = api.NO_CONTEXT
+
+        with timer.stage("generation"):
+            answer, generation = await generate_answer(data, context)
+        answer = api.clean_answer(answer)
+
+        if api.faiss_index:
+            api.answer_cache.store(query_vector, discipline, data.get("rank_level"), query_text, answer, context)
+
+    mail = await run_sync(api.prepare_report, data, answer, timer)
+    if api.mail_outbox:
+        status, response = await run_sync(api.enqueue_report, data, mail, timer)
+    else:
+        messages = api.build_mailjet_messages(**mail)
+        with timer.stage("mail"):
+            status, response = await async_mail.send(messages)
+        print(f"📤 Mailjet status: {status}")
+
+    return api.generate_result(context, answer, cached, status, response, generation, packing)
+
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + CORS_HEADERS,
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def generate(scope, receive, send):
+    print("📥 /generate (async) route hit")
+    try:
+        data = json.loads(await read_body(receive))
+    except ValueError as e:
+        print("❌ Error parsing JSON:", e)
+        return await send_json(send, 400, {"error": "Invalid JSON input"})
+
+    error = api.validate_payload(data)
+    if error:
+        return await send_json(send, 400, {"error": error})
+
+    query = parse_qs(scope.get("query_string", b"").decode())
+    flag = query.get("async", [data.get("async", os.getenv("GENERATE_ASYNC", "0"))])[0]
+    if str(flag).lower() in ("1", "true", "yes"):
+        job_id = api.job_runner.submit(data)
+        return await send_json(send, 202, {"status": "queued", "job_id": job_id, "status_url": f"/jobs/{job_id}"})
+
+    timer = StageTimer()
+    async with _semaphore():
+        try:
+            result = await run_generate(data, timer)
+        except Exception as e:
+            print("❌ Async generate failed:", str(e))
+            api.REQUEST_SECONDS.observe(timer.total(), method="POST", endpoint="/generate", status=500)
+            return await send_json(send, 500, {"error": str(e)})
+    result["timings"] = timer.as_dict()
+    api.REQUEST_SECONDS.observe(timer.total(), method="POST", endpoint="/generate", status=200)
+    await send_json(send, 200, result)
+
+
+def _wsgi_environ(scope, body):
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif key != "CONTENT_LENGTH":
+            environ[f"HTTP_{key}"] = f"{environ[f'HTTP_{key}']},{value}" if f"HTTP_{key}" in environ else value
+    return environ
+
+
+async def wsgi_bridge(scope, receive, send):
+    """Run the Flask app on one dedicated thread, streaming its body chunk by chunk (SSE included).
+
+    The call, every next() and close() all happen on that thread:
+    stream_with_context generators push Flask's context vars on entry
+    and pop them on exit, which fails if the steps hop between
+    executor threads.
+    """
+    loop = asyncio.get_running_loop()
+    environ = _wsgi_environ(scope, await read_body(receive))
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    def emit(kind, value=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+        except RuntimeError:
+            cancelled.set()  # the loop has closed; nobody is listening any more
+
+    def run():
+        try:
+            iterable = api.app(environ, start_response)
+            try:
+                emit("start")
+                for chunk in iterable:
+                    if cancelled.is_set():
+                        break
+                    if chunk:
+                        emit("body", chunk)
+            finally:
+                if hasattr(iterable, "close"):
+                    iterable.close()
+            emit("end")
+        except Exception as e:
+            emit("error", e)
+
+    threading.Thread(target=run, name="asgi-wsgi", daemon=True).start()
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "start":
+                await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+            elif kind == "body":
+                await send({"type": "http.response.body", "body": value, "more_body": True})
+            elif kind == "end":
+                await send({"type": "http.response.body", "body": b""})
+                return
+            else:
+                print("❌ WSGI bridge error:", str(value))
+                if not started.get("sent"):
+                    await send({"type": "http.response.start", "status": 500,
+                                "headers": [(b"content-type", b"application/json")]})
+                    await send({"type": "http.response.body", "body": b'{"error": "Internal server error"}'})
+                return
+            started["sent"] = True
+    finally:
+        cancelled.set()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_mail.aclose()
+            await aclient.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/generate" and scope["method"] == "POST":
+        return await generate(scope, receive, send)
+    return await wsgi_bridge(scope, receive, send)
@@ -0,0 +1,123 @@
+"""
+===============================================================
+ ANN recall vs latency benchmark
+===============================================================
+ Replays a query set against flat, IVF and HNSW configurations of
+ the corpus vectors and reports, per configuration:
+
+   • recall@k against exact (flat) search
+   • p50 / p99 single-query search latency
+   • index memory (serialised size) and build time
+
+ Queries come from --queries (one enquiry per line, embedded with
+ the same model as the corpus) or, by default, held-out corpus
+ vectors with a little noise added so no query is an exact hit.
+
+ Usage:
+   python bench/ann_benchmark.py [--index faiss_index/police_chunks.index]
+                                 [--queries queries.txt] [--k 10] [--out ann.json]
+===============================================================
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ann_index import build_ann_index, tune_index, all_vectors, default_nlist  # noqa: E402
+
+
+def synthetic_queries(vectors, n, seed=0):
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.choice(len(vectors), size=min(n, len(vectors)), replace=False)]
+    noisy = picks + rng.normal(scale=0.02, size=picks.shape).astype("float32")
+    faiss.normalize_L2(noisy)
+    return noisy
+
+
+def embedded_queries(path, model, dimensions):
+    from openai import OpenAI
+    with open(path, "r", encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    extra = {"dimensions": dimensions} if dimensions else {}
+    response = client.embeddings.create(input=texts, model=model, **extra)
+    return np.array([d.embedding for d in response.data], dtype="float32")
+
+
+def measure(index, queries, truth, k):
+    latencies = []
+    hits = 0
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, I = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(I[0]) & set(expected))
+    return {
+        "recall_at_k": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "memory_mb": round(len(faiss.serialize_index(index)) / (1024 * 1024), 2),
+    }
+
+
+def configurations(n_vectors):
+    nlist = default_nlist(n_vectors)
+    yield "flat", {}, {}
+    for nprobe in (1, 4, 8, 16, 32):
+        if nprobe <= nlist:
+            yield "ivf", {"nlist": nlist}, {"nprobe": nprobe}
+    for ef_search in (16, 32, 64, 128):
+        yield "hnsw", {"hnsw_m": 32}, {"ef_search": ef_search}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare recall and latency of FAISS index types.")
+    parser.add_argument("--index", default="faiss_index/police_chunks.index")
+    parser.add_argument("--queries", help="text file with one query per line (needs OPENAI_API_KEY)")
+    parser.add_argument("--model", default="text-embedding-3-small")
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--out", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    vectors = np.ascontiguousarray(all_vectors(faiss.read_index(args.index)), dtype="float32")
+    if args.queries:
+        queries = embedded_queries(args.queries, args.model, vectors.shape[1])
+    else:
+        queries = synthetic_queries(vectors, args.n_queries)
+    print(f"📐 {len(vectors)} vectors × {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    exact = build_ann_index(vectors, "flat")
+    _, truth = exact.search(queries, args.k)
+
+    results = []
+    built = {}
+    for kind, build_params, search_params in configurations(len(vectors)):
+        key = (kind, tuple(sorted(build_params.items())))
+        if key not in built:
+            start = time.perf_counter()
+            built[key] = (build_ann_index(vectors, kind, **build_params), time.perf_counter() - start)
+        index, build_seconds = built[key]
+        tune_index(index, **search_params)
+
+        row = {"index": kind, **build_params, **search_params, "build_s": round(build_seconds, 2)}
+        row.update(measure(index, queries, truth, args.k))
+        results.append(row)
+        params = ", ".join(f"{k}={v}" for k, v in {**build_params, **search_params}.items()) or "exact"
+        print(f"  {kind:<5} {params:<28} recall@{args.k}={row['recall_at_k']:.3f}  "
+              f"p50={row['p50_ms']:.3f}ms  p99={row['p99_ms']:.3f}ms  mem={row['memory_mb']}MB")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"vectors": len(vectors), "dims": int(vectors.shape[1]), "k": args.k, "results": results}, f, indent=2)
+        print(f"💾 Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+===============================================================
+ /generate/stream through the ASGI entrypoint
+===============================================================
+ Calls asgi_app.app in-process (no server needed) with OpenAI and
+ Mailjet pointed at the local stand-ins from stub_services.py, and
+ checks that the Flask SSE route bridged by wsgi_bridge:
+
+   • answers 200 with text/event-stream
+   • arrives as several body messages, not one buffered block
+   • ends with a "done" event and carries no "error" event
+
+ Exits 1 when a check fails.
+
+ Usage:  python bench/asgi_stream_check.py
+===============================================================
+"""
+import os
+import sys
+import json
+import asyncio
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_services import StubConfig, start_stub_server  # noqa: E402
+
+PAYLOAD = {
+    "query": "What are the grounds for a stop and search?",
+    "full_name": "Stream Check",
+    "user_email": "officer@example.org",
+    "discipline": "Police Field Operations",
+}
+
+
+async def call(app, path, payload):
+    body = json.dumps(payload).encode("utf-8")
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b"", "http_version": "1.1",
+             "scheme": "http", "server": ("127.0.0.1", 80), "client": ("127.0.0.1", 1234),
+             "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]}
+    messages = []
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return pending.pop(0) if pending else {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    await asyncio.wait_for(app(scope, receive, send), timeout=120)
+    return messages
+
+
+def main():
+    stubs = start_stub_server(StubConfig(embed_latency=0.0, chat_latency=0.05, mail_latency=0.0))
+    stub_url = f"http://127.0.0.1:{stubs.server_address[1]}"
+    os.environ.update({
+        "OPENAI_API_KEY": "stream-check", "OPENAI_BASE_URL": f"{stub_url}/v1",
+        "MJ_APIKEY_PUBLIC": "stream-check", "MJ_APIKEY_PRIVATE": "stream-check", "MAILJET_API_URL": stub_url,
+        "INDEX_LOAD": "sync", "SAVE_REPORTS": "0",
+    })
+    os.chdir(ROOT)
+    import asgi_app
+
+    messages = asyncio.run(call(asgi_app.app, "/generate/stream", PAYLOAD))
+    start = next((m for m in messages if m["type"] == "http.response.start"), {})
+    bodies = [m["body"] for m in messages if m["type"] == "http.response.body" and m.get("body")]
+    text = b"".join(bodies).decode("utf-8")
+    events = [line[len("event: "):] for line in text.splitlines() if line.startswith("event: ")]
+    headers = dict(start.get("headers", []))
+
+    failures = []
+    if start.get("status") != 200:
+        failures.append(f"status {start.get('status')}")
+    if not headers.get(b"content-type", b"").startswith(b"text/event-stream"):
+        failures.append(f"content type {headers.get(b'content-type')}")
+    if len(bodies) < 2:
+        failures.append(f"{len(bodies)} body message(s); expected a stream")
+    if "error" in events:
+        failures.append("error event: " + text[text.find("event: error"):][:300])
+    if not events or events[-1] != "done":
+        failures.append(f"last event {events[-1] if events else None!r}, expected 'done'")
+
+    print(f"📡 {len(bodies)} body messages, events: {', '.join(dict.fromkeys(events))}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    stubs.shutdown()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
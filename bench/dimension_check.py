@@ -0,0 +1,141 @@
+"""
+===============================================================
+ Shortened-embedding quality check
+===============================================================
+ Before rebuilding with build_index.py --dimensions N, check how
+ much retrieval changes: for each candidate size, the top-k results
+ with shortened vectors are compared with the top-k of the
+ full-size index on the same held-out queries.
+
+   • overlap@k   mean share of the full-size top-k that is still
+                 returned (plus p10 and worst query)
+   • top-1 match share of queries whose best chunk is unchanged
+   • index memory and p50 single-query search latency
+
+ Shortened vectors are the full ones truncated and renormalised,
+ exactly what the embeddings API returns for a `dimensions`
+ request, so no re-embedding is needed. Queries come from --queries
+ (one enquiry per line, embedded at full size; needs
+ OPENAI_API_KEY) or, by default, --n-queries corpus vectors with a
+ little noise added, held out of both indexes so no query finds
+ itself. --reduced-index also checks an index already rebuilt at a
+ smaller size (same chunk order).
+
+ Exits 1 when any size falls below --min-overlap.
+
+ Usage:
+   python bench/dimension_check.py [--dimensions 256,512,1024] [--k 8]
+                                   [--queries queries.txt] [--reduced-index path]
+                                   [--min-overlap 0.9] [--out dims.json]
+===============================================================
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ann_index import all_vectors, shorten_vectors  # noqa: E402
+from ann_benchmark import embedded_queries  # noqa: E402
+
+
+def held_out_queries(vectors, n, seed=0):
+    """(queries, ids kept in the index): noisy copies of n corpus vectors that are left out of the index."""
+    rng = np.random.default_rng(seed)
+    held_out = rng.choice(len(vectors), size=min(n, len(vectors) // 10), replace=False)
+    queries = vectors[held_out] + rng.normal(scale=0.02, size=(len(held_out), vectors.shape[1])).astype("float32")
+    faiss.normalize_L2(queries)
+    return queries, np.setdiff1d(np.arange(len(vectors)), held_out)
+
+
+def compare(index, queries, truth, k):
+    latencies = []
+    overlaps = []
+    top1 = 0
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, I = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        overlaps.append(len(set(I[0]) & set(expected)) / k)
+        top1 += int(I[0][0] == expected[0])
+    return {
+        "overlap_at_k": round(float(np.mean(overlaps)), 4),
+        "overlap_p10": round(float(np.percentile(overlaps, 10)), 4),
+        "overlap_min": round(float(np.min(overlaps)), 4),
+        "top1_match": round(top1 / len(queries), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "memory_mb": round(index.ntotal * index.d * 4 / (1024 * 1024), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare top-k retrieval of shortened embeddings with the full-size index.")
+    parser.add_argument("--index", default="faiss_index/police_chunks.index", help="full-size index")
+    parser.add_argument("--dimensions", default="256,512,1024", help="comma-separated candidate sizes")
+    parser.add_argument("--reduced-index", help="an index rebuilt with build_index.py --dimensions")
+    parser.add_argument("--queries", help="text file with one enquiry per line (needs OPENAI_API_KEY)")
+    parser.add_argument("--model", default="text-embedding-3-small")
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--min-overlap", type=float, default=0.0, help="fail below this mean overlap@k")
+    parser.add_argument("--out", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    vectors = np.ascontiguousarray(all_vectors(faiss.read_index(args.index)), dtype="float32")
+    full = vectors.shape[1]
+    if args.queries:
+        queries = embedded_queries(args.queries, args.model, None)
+        kept = np.arange(len(vectors))
+    else:
+        queries, kept = held_out_queries(vectors, args.n_queries)
+    print(f"📐 {len(kept)} vectors × {full} dims, {len(queries)} held-out queries, k={args.k}")
+
+    def flat(matrix):
+        index = faiss.IndexFlatL2(matrix.shape[1])
+        index.add(matrix)
+        return index
+
+    baseline = flat(vectors[kept])
+    _, truth = baseline.search(queries, args.k)
+    results = [dict(dimensions=full, source="full", **compare(baseline, queries, truth, args.k))]
+
+    sizes = sorted({int(d) for d in args.dimensions.split(",") if d.strip() and int(d) < full}, reverse=True)
+    for dimensions in sizes:
+        index = flat(shorten_vectors(vectors[kept], dimensions))
+        results.append(dict(dimensions=dimensions, source="truncated",
+                            **compare(index, shorten_vectors(queries, dimensions), truth, args.k)))
+
+    if args.reduced_index:
+        reduced = faiss.read_index(args.reduced_index)
+        if reduced.ntotal != len(vectors):
+            print(f"❌ {args.reduced_index} has {reduced.ntotal} vectors, the full index {len(vectors)}")
+            return 1
+        index = flat(np.ascontiguousarray(all_vectors(reduced)[kept], dtype="float32"))
+        results.append(dict(dimensions=int(reduced.d), source=args.reduced_index,
+                            **compare(index, shorten_vectors(queries, reduced.d), truth, args.k)))
+
+    failures = []
+    for row in results:
+        print(f"  {row['dimensions']:>5} dims ({row['source']}): overlap@{args.k}={row['overlap_at_k']:.3f} "
+              f"(p10 {row['overlap_p10']:.3f}, min {row['overlap_min']:.3f}), top-1 {row['top1_match']:.3f}, "
+              f"p50={row['p50_ms']:.3f}ms, mem={row['memory_mb']}MB")
+        if row["overlap_at_k"] < args.min_overlap:
+            failures.append(row["dimensions"])
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"vectors": len(kept), "full_dimensions": full, "queries": len(queries), "k": args.k,
+                       "min_overlap": args.min_overlap, "results": results}, f, indent=2)
+        print(f"💾 Results written to {args.out}")
+
+    for dimensions in failures:
+        print(f"❌ {dimensions} dims: mean overlap@{args.k} below {args.min_overlap}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+===============================================================
+ Word rendering benchmark: template renderer vs the previous code
+===============================================================
+ Renders the same answer with legacy_render_report() (the code
+ that used to live in api.generate_response: a fresh Document()
+ and per-run styling) and report_renderer.render_report(), into
+ memory, and reports documents per second for each.
+
+ Usage:  python bench/docx_benchmark.py [--n 200]
+===============================================================
+"""
+import os
+import io
+import re
+import sys
+import time
+import argparse
+import contextlib
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from docx import Document
+from docx.shared import Mm, Pt, RGBColor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from report_renderer import render_report  # noqa: E402
+
+SAMPLE_ANSWER = """### Enquirer Reply
+Hello, an officer may stop and search a person or vehicle where they have reasonable grounds to suspect stolen or prohibited articles will be found.
+
+### Action Sheet
+1. Establish reasonable grounds before the search.
+2. Give your name, station and the object and grounds of the search (GOWISELY).
+3. Record the search and offer the person a copy of the record.
+4. Use only the force that is reasonable and necessary.
+
+### Policy Notes
+- Police and Criminal Evidence Act 1984, section 1.
+- PACE Code A (stop and search).
+- **Equality Act 2010** public sector equality duty.
+"""
+
+def legacy_render_report(doc_path, full_name, query_text, answer):
+    doc = Document()
+
+    # ✅ Apply default document style
+    doc.styles['Normal'].font.name = 'Arial'
+    doc.styles['Normal'].font.size = Pt(11)
+    doc.styles['Normal'].font.color.rgb = RGBColor(0, 0, 0)
+
+    section = doc.sections[0]
+    section.page_height = Mm(297)
+    section.page_width = Mm(210)
+
+    title_para = doc.add_paragraph()
+    title_run = title_para.add_run(f"RESPONSE FOR {full_name.upper()}")
+    title_run.bold = True
+    title_run.font.name = 'Arial'
+    title_run.font.size = Pt(14)
+    title_run.font.color.rgb = RGBColor(0, 0, 0)
+    
+    uk_time = datetime.now(ZoneInfo("Europe/London"))
+    generated_datetime = uk_time.strftime("%d %B %Y at %H:%M:%S (%Z)")
+    doc.add_paragraph(f"Generated: {generated_datetime}")
+
+    para_query_heading = doc.add_paragraph()
+    run_heading = para_query_heading.add_run("ORIGINAL QUERY")
+    run_heading.bold = True
+    run_heading.font.name = 'Arial'
+    run_heading.font.size = Pt(11)
+    run_heading.font.color.rgb = RGBColor(0, 0, 0)
+
+    divider_above = doc.add_paragraph()
+    divider_above_run = divider_above.add_run("────────────────────────────────────────────")
+    divider_above_run.font.name = 'Arial'
+    divider_above_run.font.size = Pt(10)
+    divider_above_run.font.color.rgb = RGBColor(0, 0, 0)
+
+    para_query_text = doc.add_paragraph()
+    run_query = para_query_text.add_run(f'"{query_text.strip()}"')
+    run_query.italic = True
+    run_query.font.name = 'Arial'
+    run_query.font.size = Pt(11)
+    run_query.font.color.rgb = RGBColor(0, 0, 0)
+
+    divider_below = doc.add_paragraph()
+    divider_below_run = divider_below.add_run("────────────────────────────────────────────")
+    divider_below_run.font.name = 'Arial'
+    divider_below_run.font.size = Pt(10)
+    divider_below_run.font.color.rgb = RGBColor(0, 0, 0)
+
+    para1 = doc.add_paragraph()
+    run1 = para1.add_run("AI RESPONSE")
+    run1.bold = True
+    run1.font.name = 'Arial'
+    run1.font.size = Pt(11)
+    run1.font.color.rgb = RGBColor(0, 0, 0)
+
+    para2 = doc.add_paragraph()
+    run2 = para2.add_run("Note: This report was prepared using AI analysis based on the submitted query.")
+    run2.bold = True
+    run2.font.name = 'Arial'
+    run2.font.size = Pt(11)
+    run2.font.color.rgb = RGBColor(0, 0, 0)
+
+
+
+
+    divider_below = doc.add_paragraph()
+    divider_below_run = divider_below.add_run("────────────────────────────────────────────")
+    divider_below_run.font.name = 'Arial'
+    divider_below_run.font.size = Pt(10)
+    divider_below_run.font.color.rgb = RGBColor(0, 0, 0)
+
+
+    sections = re.split(r'^### (.*?)\n', answer, flags=re.MULTILINE)
+    structured = {}
+    current_title = None
+
+    for i, part in enumerate(sections):
+        content = part.strip()
+        if i == 0 and content:
+            content = re.sub(r'^\s*Enquirer Reply\s*', '', content, flags=re.IGNORECASE)
+            content = re.sub(r'^\s*Hello,\s*', '', content, flags=re.IGNORECASE)
+            structured["Enquirer Reply"] = content
+        elif i % 2 == 1:
+            current_title = content
+        elif i % 2 == 0 and current_title:
+            if current_title.lower() in ["enquirer reply", "initial response"]:
+                lines = content.splitlines()
+                cleaned_lines = [line for line in lines if not re.match(r'^\s*(enquirer reply|hello,?)\s*$', line, flags=re.IGNORECASE)]
+                content = "\n".join(cleaned_lines).strip()
+            structured[current_title] = content
+
+    if not structured:
+        print("⚠️ GPT returned unstructured content. Using entire answer as 'Initial Response'.")
+        structured["Initial Response"] = answer.strip()
+
+    rename = {"Enquirer Reply": "Initial Response"}
+    for title in structured:
+        heading = doc.add_paragraph()
+        heading_run = heading.add_run(rename.get(title, title).upper())
+        heading_run.bold = True
+        heading_run.font.name = 'Arial'
+        heading_run.font.size = Pt(12)
+        heading_run.font.color.rgb = RGBColor(0, 0, 0)
+
+        if title in ["Action Sheet", "Policy Notes"]:
+           lines = structured[title].splitlines()
+           for line in lines:
+              clean = line.strip()
+              clean = re.sub(r'^[-•–]?\s*\d+[.)]?\s*', '', clean)
+              clean = re.sub(r'^[-•–]\s*', '', clean)
+              if clean:
+                  para = doc.add_paragraph(clean, style='List Number')
+                  para.paragraph_format.left_indent = Mm(5) 
+
+        else:
+            cleaned_text = re.sub(r'\*\*(.*?)\*\*', r'\1', structured[title])
+            para = doc.add_paragraph()
+            run = para.add_run(cleaned_text)
+            run.font.name = 'Arial'
+            run.font.size = Pt(11)
+            run.font.color.rgb = RGBColor(0, 0, 0)
+
+    doc.add_paragraph()
+    doc.add_paragraph("────────────────────────────────────────────")
+    doc.add_paragraph("This document was generated by AIVS Software Limited using AI assistance (OpenAI). Please review for accuracy and relevance before taking any formal action.")
+    doc.add_paragraph("© AIVS Software Limited 2025. All rights reserved.")
+    doc.add_paragraph(datetime.now(ZoneInfo("Europe/London")).strftime("Report generated on %d %B %Y at %H:%M:%S (%Z)"))
+
+    doc.save(doc_path)
+
+
+
+def bench(render, n):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(n):
+            render(io.BytesIO(), "Jo Bloggs", "What are the grounds for stop and search?", SAMPLE_ANSWER)
+    return n / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare Word report rendering throughput.")
+    parser.add_argument("--n", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    bench(render_report, 5)  # warm the template
+    legacy = bench(legacy_render_report, args.n)
+    current = bench(render_report, args.n)
+    print(f"📄 legacy renderer:   {legacy:7.1f} docs/s")
+    print(f"📄 template renderer: {current:7.1f} docs/s  ({current / legacy:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+===============================================================
+ Import-time budget check for api.py
+===============================================================
+ Imports api in a fresh interpreter with INDEX_LOAD=manual (so
+ the loader thread cannot race the measurement), then runs the
+ loader itself, and checks that:
+
+   • importing api stays under the budget (--budget, seconds)
+   • none of the heavy packages (faiss, numpy, openai, docx,
+     requests) is imported by api itself — they belong to the
+     background loader and first use
+   • the background loader loads the index and finishes warm-up
+     within --ready-timeout seconds (/readyz only needs the index;
+     warm-up is checked here so it does not silently regress)
+
+ Exits 1 when a check fails, so it can gate a deploy.
+
+ Usage:
+   python bench/import_budget.py [--budget 1.0] [--ready-timeout 60] [--out budget.json]
+===============================================================
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY = ("faiss", "numpy", "openai", "docx", "requests")
+
+PROBE = """
+import sys, json, time, threading
+started = time.perf_counter()
+import api
+imported = time.perf_counter() - started
+eager = sorted(name for name in {heavy!r} if name in sys.modules)
+threading.Thread(target=api.load_and_warm_up, daemon=True).start()
+api.indexes_ready.wait({timeout})
+while not api.STARTUP["warmed_up"] and not api.STARTUP["error"] and time.perf_counter() - started < {timeout}:
+    time.sleep(0.05)
+print("BUDGET " + json.dumps({{"import_s": imported, "ready_s": time.perf_counter() - started,
+                                "eager_heavy_imports": eager, "index_loaded": api.STARTUP["index_loaded"],
+                                "vectors": api.STARTUP["vectors"], "warmed_up": api.STARTUP["warmed_up"]}}))
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check api.py import time and lazy loading.")
+    parser.add_argument("--budget", type=float, default=1.0, help="maximum seconds to import api")
+    parser.add_argument("--ready-timeout", type=float, default=60.0)
+    parser.add_argument("--out", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, INDEX_LOAD="manual", OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "budget-check"))
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE.format(heavy=HEAVY, timeout=args.ready_timeout)],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("BUDGET ")]
+    if proc.returncode != 0 or not lines:
+        print(proc.stdout[-2000:], proc.stderr[-2000:])
+        print("❌ api import failed")
+        return 1
+
+    result = json.loads(lines[-1][len("BUDGET "):])
+    result["budget_s"] = args.budget
+
+    failures = []
+    if result["import_s"] > args.budget:
+        failures.append(f"import took {result['import_s']:.3f}s (budget {args.budget}s)")
+    if result["eager_heavy_imports"]:
+        failures.append(f"imported eagerly: {', '.join(result['eager_heavy_imports'])}")
+    if not (result["index_loaded"] and result["warmed_up"]):
+        failures.append("index not loaded and warmed up within the timeout")
+
+    print(f"⏱️ import api: {result['import_s']:.3f}s (budget {args.budget}s), ready after {result['ready_s']:.2f}s, "
+          f"{result['vectors']} vectors")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(dict(result, failures=failures), f, indent=2)
+        print(f"💾 Results written to {args.out}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+===============================================================
+ Job store retention check
+===============================================================
+ Fills MemoryJobStore and SQLiteJobStore with finished and
+ unfinished jobs and checks that creating a job prunes:
+
+   • done / failed jobs finished more than ttl seconds ago
+   • the oldest finished jobs beyond max_finished
+   • never a queued or running job, however old
+
+ and that SQLiteJobStore marks unfinished jobs failed when their
+ owning process has exited (or its pid now belongs to another
+ process), on open and on a poll, while a live owner's jobs stay
+ queued.
+
+ Exits 1 when a check fails.
+
+ Usage:  python bench/job_store_check.py
+===============================================================
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from jobs import MemoryJobStore, SQLiteJobStore, QUEUED, RUNNING, DONE, FAILED, process_token  # noqa: E402
+
+
+def fill(store, now):
+    """Two old unfinished jobs, then finished jobs 0..9 (0 oldest); returns their ids."""
+    owner = process_token()
+    store.create({"id": "queued", "status": QUEUED, "created": now - 10 * 86400, "owner": owner})
+    store.create({"id": "running", "status": RUNNING, "created": now - 10 * 86400, "owner": owner})
+    store.update("running", started=now - 10 * 86400)
+    for n in range(10):
+        job_id = f"job-{n}"
+        store.create({"id": job_id, "status": QUEUED, "created": now - 1000 + n})
+        store.update(job_id, status=DONE if n % 2 else FAILED, finished=now - 1000 + n * 100)
+
+
+def check(name, make_store):
+    failures = []
+    now = time.time()
+
+    # Count limit only: the 4 most recently finished jobs survive the next create
+    store = make_store(ttl=0, max_finished=4)
+    fill(store, now)
+    store.create({"id": "new", "status": QUEUED, "created": now})
+    kept = {f"job-{n}" for n in range(10) if store.get(f"job-{n}")}
+    if kept != {"job-6", "job-7", "job-8", "job-9"}:
+        failures.append(f"max_finished=4 kept {sorted(kept)}")
+
+    # Age limit only: jobs finished more than 450s ago go (job-0..job-5 finished 1000..500s ago)
+    store = make_store(ttl=450, max_finished=None)
+    fill(store, now)
+    store.create({"id": "new", "status": QUEUED, "created": now})
+    kept = {f"job-{n}" for n in range(10) if store.get(f"job-{n}")}
+    if kept != {"job-6", "job-7", "job-8", "job-9"}:
+        failures.append(f"ttl=450 kept {sorted(kept)}")
+
+    for job_id in ("queued", "running"):
+        if (store.get(job_id) or {}).get("status") not in (QUEUED, RUNNING):
+            failures.append(f"unfinished job {job_id!r} was pruned or failed")
+
+    print(f"{'✅' if not failures else '❌'} {name}")
+    return [f"{name}: {failure}" for failure in failures]
+
+
+def check_orphans(path):
+    failures = []
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    dead = f"{exited.stdout.strip()}:1"
+    live = process_token()
+    reused = f"{os.getpid()}:{live.split(':')[1] or 0}0"  # this pid, but a different process start
+
+    store = SQLiteJobStore(path)
+    for job_id, owner in (("dead", dead), ("reused", reused), ("live", live)):
+        store.create({"id": job_id, "status": QUEUED, "created": time.time(), "owner": owner})
+    store.update("live", status=RUNNING)
+
+    reopened = SQLiteJobStore(path)
+    for job_id, expected in (("dead", FAILED), ("reused", FAILED), ("live", RUNNING)):
+        if reopened.get(job_id)["status"] != expected:
+            failures.append(f"{job_id} owner: status {reopened.get(job_id)['status']}, expected {expected}")
+
+    # Found on a poll too, without reopening the store
+    reopened.create({"id": "polled", "status": QUEUED, "created": time.time(), "owner": dead})
+    if reopened.get("polled")["status"] != FAILED:
+        failures.append("orphaned job still queued when polled")
+
+    print(f"{'✅' if not failures else '❌'} SQLiteJobStore orphaned jobs")
+    return [f"SQLiteJobStore: {failure}" for failure in failures]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = iter(os.path.join(tmp, f"jobs-{n}.sqlite") for n in range(10))
+        failures = check("MemoryJobStore", MemoryJobStore)
+        failures += check("SQLiteJobStore", lambda **kw: SQLiteJobStore(next(paths), **kw))
+        failures += check_orphans(next(paths))
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
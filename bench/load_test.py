@@ -0,0 +1,308 @@
+"""
+===============================================================
+ Offline end-to-end load test for /generate
+===============================================================
+ Measures throughput of the whole API without touching OpenAI or
+ Mailjet:
+
+   1. starts the local stand-ins from stub_services.py (embeddings,
+      chat completions, Mailjet send) with configurable latency
+   2. builds a small index from a random sample of data/ with
+      build_index.build(), embedded by the stub, in a temp dir
+   3. runs gunicorn api:app against that index and those stubs
+   4. sends /generate requests at each concurrency level and
+      records requests per second, p50 / p95 / p99 latency and
+      the per-stage timings every response carries
+
+ Results are written as JSON (with the git commit) so runs can be
+ compared across commits with --compare.
+
+ The answer cache is disabled (unless --answer-cache) and reports
+ are not saved, so every request runs the full pipeline.
+
+ Usage:
+   python bench/load_test.py [--concurrency 1,2,4,8,16] [--requests 40]
+                             [--workers 2] [--threads 8] [--sample 300]
+                             [--chat-latency 1.0] [--embed-latency 0.05]
+                             [--mail-latency 0.2] [--out load.json]
+                             [--compare previous.json]
+===============================================================
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_services import StubConfig, start_stub_server  # noqa: E402
+
+# Settings that would make the server under test differ from a plain deployment
+ISOLATED_ENV = ("EMBEDDING_CACHE_PATH", "MAIL_OUTBOX_PATH", "JOB_STORE_PATH", "METRICS_DIR", "INDEX_LOAD", "GUNICORN_PRELOAD")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def build_sample_index(work_dir, sample, seed, stub_url):
+    """Build an index over ``sample`` random chunks of data/; returns (index dir, sampled chunk texts)."""
+    from openai import OpenAI
+    from build_index import build, read_chunk_log
+
+    data_dir = os.path.join(ROOT, "data")
+    rows = [row for row in read_chunk_log(data_dir) if os.path.exists(os.path.join(data_dir, row["chunk_filename"]))]
+    rows = random.Random(seed).sample(rows, min(sample, len(rows)))
+
+    sample_dir = os.path.join(work_dir, "data")
+    index_dir = os.path.join(work_dir, "faiss_index")
+    os.makedirs(sample_dir)
+    os.makedirs(index_dir)
+    with open(os.path.join(sample_dir, "chunk_log.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    texts = []
+    for row in rows:
+        os.symlink(os.path.join(data_dir, row["chunk_filename"]), os.path.join(sample_dir, row["chunk_filename"]))
+        with open(os.path.join(data_dir, row["chunk_filename"]), "r", encoding="utf-8") as f:
+            texts.append(f.read())
+
+    build(sample_dir, index_dir, client=OpenAI(api_key="load-test", base_url=f"{stub_url}/v1"))
+    return index_dir, texts
+
+
+def make_payloads(texts, n, seed):
+    """Distinct enquiries drawn from the sampled chunks, so retrieval has something to find."""
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(n):
+        words = rng.choice(texts).split()
+        start = rng.randrange(max(1, len(words) - 12))
+        payloads.append({
+            "query": f"What is the procedure for {' '.join(words[start:start + 12])}? (enquiry {i})",
+            "full_name": "Load Test",
+            "user_email": "officer@example.org",
+            "supervisor_email": "supervisor@example.org",
+            "discipline": "Police Field Operations",
+            "rank_level": "PC",
+        })
+    return payloads
+
+
+def start_server(args, index_dir, stub_url, port, log_path):
+    env = {k: v for k, v in os.environ.items() if k not in ISOLATED_ENV}
+    env.update({
+        "OPENAI_API_KEY": "load-test",
+        "OPENAI_BASE_URL": f"{stub_url}/v1",
+        "MJ_APIKEY_PUBLIC": "load-test",
+        "MJ_APIKEY_PRIVATE": "load-test",
+        "MAILJET_API_URL": stub_url,
+        "FAISS_INDEX_PATH": os.path.join(index_dir, "police_chunks.index"),
+        "METADATA_STORE_PATH": os.path.join(index_dir, "police_metadata.bin"),
+        "CHUNK_PACK_PATH": os.path.join(index_dir, "police_chunks.pack"),
+        "BM25_INDEX_PATH": os.path.join(index_dir, "police_bm25.npz"),
+        "SAVE_REPORTS": "0",
+    })
+    if not args.answer_cache:
+        env["ANSWER_CACHE_THRESHOLD"] = "2"
+    command = [
+        sys.executable, "-m", "gunicorn", args.app,
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--threads", str(args.threads),
+        "--timeout", "300",
+    ]
+    if args.worker_class:
+        command += ["--worker-class", args.worker_class]
+    log = open(log_path, "w")
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(url, server, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/readyz", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"server not ready after {timeout}s")
+
+
+def post_generate(url, payload):
+    started = time.perf_counter()
+    request = urllib.request.Request(f"{url}/generate", data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return time.perf_counter() - started, response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return time.perf_counter() - started, e.code, None
+    except (urllib.error.URLError, OSError):
+        return time.perf_counter() - started, None, None
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 4), "p95": round(float(p95), 4), "p99": round(float(p99), 4),
+            "mean": round(float(np.mean(values)), 4)}
+
+
+def run_level(url, payloads, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda payload: post_generate(url, payload), payloads))
+    wall = time.perf_counter() - started
+
+    ok = [(latency, body) for latency, status, body in results if status == 200 and body]
+    stages = {}
+    for _, body in ok:
+        for stage, seconds in (body.get("timings") or {}).items():
+            stages.setdefault(stage, []).append(seconds)
+    return dict(
+        concurrency=concurrency,
+        requests=len(results),
+        errors=len(results) - len(ok),
+        wall_s=round(wall, 3),
+        rps=round(len(ok) / wall, 3) if wall else None,
+        latency_s=percentiles([latency for latency, _ in ok]),
+        stages_s={stage: percentiles(values) for stage, values in sorted(stages.items())},
+    )
+
+
+def compare(previous_path, levels):
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    before = {level["concurrency"]: level for level in previous["levels"]}
+    print(f"📊 Against {previous_path} (commit {previous.get('commit')}):")
+    for level in levels:
+        old = before.get(level["concurrency"])
+        if not old or not old["rps"] or old["latency_s"]["p95"] is None or level["latency_s"]["p95"] is None:
+            continue
+        print(f"   c={level['concurrency']:<3} rps {old['rps']:.2f} → {level['rps']:.2f} "
+              f"({(level['rps'] / old['rps'] - 1) * 100:+.1f}%), "
+              f"p95 {old['latency_s']['p95']:.3f}s → {level['latency_s']['p95']:.3f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test of /generate against local stubs.")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed requests before the first level")
+    parser.add_argument("--app", default="api:app")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--worker-class", help="gunicorn worker class (default: gthread when --threads > 1)")
+    parser.add_argument("--sample", type=int, default=300, help="number of data/ chunks in the synthetic index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--chat-latency", type=float, default=1.0)
+    parser.add_argument("--mail-latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.1, help="± fraction of each stub latency")
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    parser.add_argument("--ready-timeout", type=float, default=120.0)
+    parser.add_argument("--out", help="results JSON (default: load_test_<commit>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the temp dir (index and server log)")
+    args = parser.parse_args(argv)
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    commit = git_commit()
+    work_dir = tempfile.mkdtemp(prefix="load_test_")
+    stub_config = StubConfig(args.embed_latency, args.chat_latency, args.mail_latency, args.jitter)
+    stubs = start_stub_server(stub_config)
+    stub_url = f"http://127.0.0.1:{stubs.server_address[1]}"
+    server = None
+
+    try:
+        # The index is built with no artificial latency
+        stub_config.embed_latency = 0.0
+        index_dir, texts = build_sample_index(work_dir, args.sample, args.seed, stub_url)
+        stub_config.embed_latency = args.embed_latency
+
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        log_path = os.path.join(work_dir, "gunicorn.log")
+        server = start_server(args, index_dir, stub_url, port, log_path)
+        wait_ready(url, server, args.ready_timeout)
+        print(f"🚦 {args.app} ready on {url} ({args.workers} workers × {args.threads} threads, {len(texts)} chunks)")
+
+        payloads = make_payloads(texts, args.warmup + args.requests * len(levels), args.seed)
+        for payload in payloads[:args.warmup]:
+            post_generate(url, payload)
+
+        results = []
+        for n, concurrency in enumerate(levels):
+            start = args.warmup + n * args.requests
+            level = run_level(url, payloads[start:start + args.requests], concurrency)
+            results.append(level)
+            latency = level["latency_s"]
+            print(f"⏱️ c={concurrency:<3} {level['rps']:.2f} req/s, p50 {latency['p50']}s, p95 {latency['p95']}s, "
+                  f"p99 {latency['p99']}s, {level['errors']} errors")
+    except Exception:
+        if server is not None:
+            print(f"📜 Server log: {os.path.join(work_dir, 'gunicorn.log')}")
+            args.keep = True
+        raise
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        stubs.shutdown()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "commit": commit,
+        "created": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "config": {
+            "app": args.app, "workers": args.workers, "threads": args.threads, "worker_class": args.worker_class,
+            "sample_chunks": len(texts), "requests_per_level": args.requests, "answer_cache": args.answer_cache,
+            "stub_latency_s": {"embeddings": args.embed_latency, "chat": args.chat_latency, "mail": args.mail_latency},
+            "jitter": args.jitter, "generation_strategy": os.getenv("GENERATION_STRATEGY", "two_pass"),
+        },
+        "stub_calls": stub_config.counts,
+        "levels": results,
+    }
+    out = args.out or f"load_test_{commit}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Results written to {out}")
+
+    if args.compare:
+        compare(args.compare, results)
+    return 1 if any(level["errors"] for level in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
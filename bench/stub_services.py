@@ -0,0 +1,187 @@
+"""
+===============================================================
+ Local stand-ins for OpenAI and Mailjet (for load tests)
+===============================================================
+ One threaded HTTP server answering:
+
+   POST /v1/embeddings         deterministic hashed bag-of-words
+                               vectors (similar texts → similar
+                               vectors), with usage
+   POST /v1/chat/completions   a canned report with the usual
+                               ### headings, plain or streamed (SSE)
+   POST /v3.1/send             a Mailjet success response per message
+
+ Each endpoint sleeps for a configurable latency (plus optional
+ random jitter) before answering, so the API sees realistic waits
+ without paying for, or depending on, the real services.
+
+ Point the API at it with:
+   OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+   MAILJET_API_URL=http://127.0.0.1:<port>
+
+ Usage:  python bench/stub_services.py [--port 8099] [--chat-latency 1.5]
+===============================================================
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+CANNED_ANSWER = """### Enquirer Reply
+Hello, an officer may stop and search a person where they have reasonable grounds to suspect that stolen or prohibited articles will be found. The grounds must be objective and based on information or intelligence, not on personal factors alone.
+
+### Action Sheet
+1. Confirm the power being used and the grounds for the search.
+2. Give your name, station, the object of the search and the person's entitlement to a copy of the record.
+3. Record the search on the body-worn camera and complete the search record before the end of the shift.
+
+### Policy Notes
+Follow the force stop and search policy and PACE Code A. Searches in public are limited to outer coat, jacket and gloves.
+
+### Risks
+Searching without recorded grounds exposes the officer to complaint and the evidence to exclusion.
+"""
+
+
+@lru_cache(maxsize=8192)
+def word_vector(word, dimensions):
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(dimensions, dtype="float32")
+
+
+def embed_text(text, dimensions):
+    """Sum of one pseudo-random vector per word, normalised (stable across processes)."""
+    vector = np.zeros(dimensions, dtype="float32")
+    for word in WORD_RE.findall(text.lower()):
+        vector += word_vector(word, dimensions)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class StubConfig:
+    def __init__(self, embed_latency=0.05, chat_latency=1.0, mail_latency=0.2, jitter=0.0, dimensions=1536):
+        self.embed_latency = embed_latency
+        self.chat_latency = chat_latency
+        self.mail_latency = mail_latency
+        self.jitter = jitter
+        self.dimensions = dimensions
+        self.counts = {"embeddings": 0, "chat": 0, "mail": 0}
+        self._lock = threading.Lock()
+
+    def wait(self, latency, endpoint):
+        with self._lock:
+            self.counts[endpoint] += 1
+        time.sleep(max(0.0, latency + random.uniform(-self.jitter, self.jitter) * latency))
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, payload, status=200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.endswith("/embeddings"):
+                self.embeddings(body)
+            elif self.path.endswith("/chat/completions"):
+                self.chat(body)
+            elif self.path.endswith("/v3.1/send"):
+                self.mail(body)
+            else:
+                self.send_json({"error": f"no stub for {self.path}"}, 404)
+
+        def embeddings(self, body):
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            config.wait(config.embed_latency, "embeddings")
+            dimensions = body.get("dimensions") or config.dimensions
+            tokens = sum(len(text.split()) for text in texts)
+            self.send_json({
+                "object": "list",
+                "model": body.get("model"),
+                "data": [{"object": "embedding", "index": i, "embedding": embed_text(text, dimensions)} for i, text in enumerate(texts)],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+        def chat(self, body):
+            config.wait(config.chat_latency, "chat")
+            prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+            completion_tokens = len(CANNED_ANSWER) // 4
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+            base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model")}
+            if not body.get("stream"):
+                return self.send_json(dict(base, object="chat.completion", usage=usage, choices=[
+                    {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": CANNED_ANSWER}}
+                ]))
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            pieces = [CANNED_ANSWER[i:i + 40] for i in range(0, len(CANNED_ANSWER), 40)]
+            for piece in pieces:
+                chunk = dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self.wfile.write(f"data: {json.dumps(dict(base, object='chat.completion.chunk', choices=[], usage=usage))}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def mail(self, body):
+            config.wait(config.mail_latency, "mail")
+            self.send_json({"Messages": [
+                {"Status": "success", "CustomID": m.get("CustomID", ""), "To": [{"Email": to["Email"]} for to in m.get("To", [])]}
+                for m in body.get("Messages", [])
+            ]})
+
+    return Handler
+
+
+def start_stub_server(config=None, host="127.0.0.1", port=0):
+    """Start the stubs on a daemon thread; returns the server (its port is server.server_address[1])."""
+    server = ThreadingHTTPServer((host, port), make_handler(config or StubConfig()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-services", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run local OpenAI and Mailjet stand-ins.")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--chat-latency", type=float, default=1.0)
+    parser.add_argument("--mail-latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.0, help="± fraction of each latency, e.g. 0.2")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(args.embed_latency, args.chat_latency, args.mail_latency, args.jitter, args.dimensions)
+    server = start_stub_server(config, port=args.port)
+    print(f"🧪 Stubs listening on http://127.0.0.1:{server.server_address[1]} (OpenAI at /v1, Mailjet at /v3.1/send)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+===============================================================
+ BM25 lexical index over the chunk corpus
+===============================================================
+ Catches exact statute tokens ("s.1", "47C", "Code G") that the
+ embedding search sometimes misses. Stored as flat numpy arrays
+ (CSR postings) in one uncompressed .npz so it loads in a few ms:
+
+   terms        newline-joined vocabulary (uint8)
+   term_starts  int64  [V + 1]  posting range per term
+   doc_ids      int32  [P]      doc (FAISS id) per posting
+   tfs          uint16 [P]      term frequency per posting
+   doc_lens     int32  [N]      tokens per doc
+
+ Results are fused with FAISS hits by reciprocal rank fusion.
+
+ Build:  python bm25_index.py
+===============================================================
+"""
+import os
+import re
+import sys
+import argparse
+from collections import Counter
+
+import numpy as np
+
+DEFAULT_BM25_PATH = "faiss_index/police_bm25.npz"
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[./][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def build_bm25(texts, out_path=DEFAULT_BM25_PATH):
+    texts = list(texts)
+    vocab = {}
+    postings = []
+    doc_lens = np.zeros(len(texts), dtype="int32")
+
+    for doc_id, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lens[doc_id] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            postings.append((vocab.setdefault(term, len(vocab)), doc_id, min(tf, 65535)))
+
+    postings.sort()
+    term_ids = np.array([p[0] for p in postings], dtype="int64")
+    term_starts = np.searchsorted(term_ids, np.arange(len(vocab) + 1)).astype("int64")
+    terms = sorted(vocab, key=vocab.get)
+
+    tmp_path = f"{out_path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype="uint8"),
+        term_starts=term_starts,
+        doc_ids=np.array([p[1] for p in postings], dtype="int32"),
+        tfs=np.array([p[2] for p in postings], dtype="uint16"),
+        doc_lens=doc_lens,
+    )
+    os.replace(tmp_path, out_path)
+    return len(vocab), len(postings)
+
+
+class BM25Index:
+    def __init__(self, path=DEFAULT_BM25_PATH, k1=1.2, b=0.75):
+        with np.load(path) as arrays:
+            terms = arrays["terms"].tobytes().decode("utf-8").split("\n")
+            self.term_starts = arrays["term_starts"]
+            self.doc_ids = arrays["doc_ids"]
+            self.tfs = arrays["tfs"].astype("float32")
+            doc_lens = arrays["doc_lens"].astype("float32")
+
+        self.path = path
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.n_docs = len(doc_lens)
+        self.k1 = k1
+        # Per-document length normalisation is fixed, so precompute it once
+        self._norm = k1 * (1 - b + b * doc_lens / max(float(doc_lens.mean()), 1.0))
+
+    def __len__(self):
+        return self.n_docs
+
+    def search(self, query, k, allowed=None):
+        """Top-``k`` doc ids for ``query``; ``allowed`` is an optional boolean mask over docs."""
+        scores = np.zeros(self.n_docs, dtype="float32")
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_starts[term_id], self.term_starts[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            df = end - start
+            idf = np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + self._norm[docs])
+
+        if allowed is not None:
+            scores[~allowed] = 0
+        k = min(k, self.n_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [int(i) for i in top if scores[i] > 0]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several ranked id lists into one, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def main(argv=None):
+    import json
+    from chunk_store import read_chunk_texts, DEFAULT_METADATA_PATH, DEFAULT_DATA_DIR
+
+    parser = argparse.ArgumentParser(description="Build the BM25 index from the chunk files.")
+    parser.add_argument("--metadata", default=DEFAULT_METADATA_PATH)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--out", default=DEFAULT_BM25_PATH)
+    args = parser.parse_args(argv)
+
+    # Built from the unredacted files so statute numbers stay searchable
+    with open(args.metadata, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    n_terms, n_postings = build_bm25(read_chunk_texts(metadata, args.data_dir), args.out)
+    print(f"🔤 BM25 index: {len(metadata)} chunks, {n_terms} terms, {n_postings} postings → {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
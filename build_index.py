@@ -0,0 +1,266 @@
+"""
+===============================================================
+ Offline, incremental FAISS index build
+===============================================================
+ Walks data/chunk_log.csv, hashes every chunk file and only sends
+ chunks whose content hash is not already in the previous build
+ to the embeddings API. Unchanged chunks reuse their stored vector.
+
+   • exact-duplicate chunk files are embedded and stored once
+   • embeddings are requested in large batches, a few at a time,
+     with exponential backoff on failure
+   • the index, metadata, chunk pack and manifest are written to
+     temporary files and swapped into place at the end
+
+ Embeddings can be shortened (--dimensions, or EMBEDDING_DIMENSIONS;
+ text-embedding-3 models only). The manifest records the size and
+ the API requests query embeddings to match. Going down in size
+ reuses the stored vectors (truncated and renormalised) instead of
+ calling the API again; going up re-embeds everything.
+
+ Usage:  python build_index.py [--batch-size 256] [--concurrency 4]
+                               [--index-type flat|ivf|hnsw] [--dimensions 512]
+===============================================================
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import faiss
+
+from chunk_store import write_redacted_pack
+from bm25_index import build_bm25
+from metadata_store import write_metadata_store
+from ann_index import INDEX_TYPES, build_ann_index, describe_index, all_vectors, shorten_vectors
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+INDEX_DIR = "faiss_index"
+INDEX_FILE = "police_chunks.index"
+METADATA_FILE = "police_metadata.json"
+METADATA_STORE_FILE = "police_metadata.bin"
+TAGGED_METADATA_FILE = "police_metadata_tagged.json"
+PACK_FILE = "police_chunks.pack"
+BM25_FILE = "police_bm25.npz"
+MANIFEST_FILE = "police_chunks.manifest.json"
+ERROR_LOG_FILE = "embedding_errors.log"
+
+
+def read_chunk_log(data_dir):
+    with open(os.path.join(data_dir, "chunk_log.csv"), "r", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def collect_chunks(data_dir):
+    """Return (metadata, texts, hashes) for every unique chunk in the log, in log order."""
+    metadata, texts, hashes = [], [], []
+    seen = set()
+    missing = duplicates = 0
+
+    for row in read_chunk_log(data_dir):
+        chunk_file = row["chunk_filename"]
+        path = os.path.join(data_dir, chunk_file)
+        if not os.path.exists(path):
+            missing += 1
+            continue
+
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read().strip()
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if digest in seen:
+            duplicates += 1
+            continue
+        seen.add(digest)
+
+        metadata.append({
+            "source_file": row["original_filename"],
+            "chunk_file": chunk_file,
+            "chunk_number": int(row["chunk_number"]),
+            "word_count": int(row["word_count"]),
+            "chunk_path": row["chunk_path"],
+        })
+        texts.append(text)
+        hashes.append(digest)
+
+    print(f"📚 {len(metadata)} chunks ({duplicates} duplicates skipped, {missing} missing files)")
+    return metadata, texts, hashes
+
+
+def load_previous_vectors(out_dir):
+    """Map content hash -> vector from the previous build, if there is one."""
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    if not (os.path.exists(manifest_path) and os.path.exists(index_path)):
+        return {}, None
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    index = faiss.read_index(index_path)
+    if index.ntotal != len(manifest["hashes"]):
+        print("⚠️ Previous manifest does not match the index; rebuilding everything.")
+        return {}, manifest
+
+    return dict(zip(manifest["hashes"], all_vectors(index))), manifest
+
+
+def retryable(error):
+    """Rate limits, connection failures, timeouts and 5xx answers; any other error would just fail again."""
+    import openai
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def embed_with_retry(client, texts, model, max_retries=6, dimensions=None):
+    delay = 1.0
+    extra = {"dimensions": dimensions} if dimensions else {}
+    for attempt in range(1, max_retries + 1):
+        try:
+            response = client.embeddings.create(input=[t.replace("\n", " ") for t in texts], model=model, **extra)
+            return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+        except Exception as e:
+            if attempt == max_retries or not retryable(e):
+                raise
+            wait = delay * (1 + random.random())
+            print(f"🔁 Embedding batch failed ({e}); retry {attempt}/{max_retries - 1} in {wait:.1f}s")
+            time.sleep(wait)
+            delay = min(delay * 2, 60)
+
+
+def embed_missing(client, texts, model, batch_size, concurrency, error_log, dimensions=None):
+    """Embed ``texts`` in batches on a bounded thread pool; returns vectors in input order."""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    vectors = [None] * len(batches)
+
+    def run(i):
+        try:
+            vectors[i] = embed_with_retry(client, batches[i], model, dimensions=dimensions)
+            print(f"🧠 Embedded batch {i + 1}/{len(batches)} ({len(batches[i])} chunks)")
+        except Exception as e:
+            with open(error_log, "a", encoding="utf-8") as f:
+                f.write(f"{datetime.utcnow().isoformat()} batch {i}: {e}\n")
+            raise
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, range(len(batches))))
+
+    return [v for batch in vectors for v in batch]
+
+
+def _write_json(path, obj):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2)
+
+
+def reusable_vectors(previous, manifest, dimensions):
+    """Stored vectors that can stand in for embeddings of size ``dimensions`` (None = the model's full size)."""
+    if not previous:
+        return previous
+    stored = manifest.get("dimensions")
+    stored_request = stored if manifest.get("shortened") else None
+    if stored_request == dimensions:
+        return previous
+    if dimensions and stored and stored >= dimensions:
+        print(f"✂️ Shortening {len(previous)} stored {stored}-dim vectors to {dimensions} dims")
+        return dict(zip(previous, shorten_vectors(np.array(list(previous.values())), dimensions)))
+    print(f"⚠️ Previous build has {stored}-dim vectors; re-embedding everything at {dimensions or 'full'} dims.")
+    return {}
+
+
+def build(data_dir="data", out_dir=INDEX_DIR, model=EMBEDDING_MODEL, batch_size=256, concurrency=4,
+          client=None, index_type="flat", nlist=None, hnsw_m=32, ef_construction=200, dimensions=EMBEDDING_DIMENSIONS):
+    tagged_path = os.path.join(out_dir, TAGGED_METADATA_FILE)
+    previous_tags = {}
+    if os.path.exists(tagged_path):
+        with open(tagged_path, "r", encoding="utf-8") as f:
+            previous_tags = {m["chunk_file"]: m.get("discipline", "general") for m in json.load(f)}
+
+    metadata, texts, hashes = collect_chunks(data_dir)
+    previous, manifest = load_previous_vectors(out_dir)
+    if manifest and manifest.get("model") != model:
+        print(f"⚠️ Previous build used {manifest.get('model')}; re-embedding everything with {model}.")
+        previous = {}
+    elif manifest:
+        previous = reusable_vectors(previous, manifest, dimensions)
+
+    todo = [i for i, h in enumerate(hashes) if h not in previous]
+    print(f"♻️ Reusing {len(hashes) - len(todo)} vectors, embedding {len(todo)} changed chunks")
+
+    new_vectors = {}
+    if todo:
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        embedded = embed_missing(
+            client, [texts[i] for i in todo], model, batch_size, concurrency,
+            os.path.join(out_dir, ERROR_LOG_FILE), dimensions=dimensions
+        )
+        new_vectors = {hashes[i]: v for i, v in zip(todo, embedded)}
+
+    matrix = np.array([previous.get(h, new_vectors.get(h)) for h in hashes], dtype="float32")
+    index = build_ann_index(matrix, index_type, nlist=nlist, hnsw_m=hnsw_m, ef_construction=ef_construction)
+
+    tagged = [dict(m, discipline=previous_tags.get(m["chunk_file"], "general")) for m in metadata]
+    new_manifest = {
+        "model": model,
+        "dimensions": int(matrix.shape[1]),
+        "shortened": dimensions is not None,
+        "count": len(hashes),
+        "index": describe_index(index),
+        "built": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "hashes": hashes,
+    }
+
+    # ✍️ Write everything to temporary files first, then swap into place (index last)
+    targets = {
+        METADATA_FILE: lambda p: _write_json(p, metadata),
+        TAGGED_METADATA_FILE: lambda p: _write_json(p, tagged),
+        METADATA_STORE_FILE: lambda p: write_metadata_store(tagged, p),
+        PACK_FILE: lambda p: write_redacted_pack(texts, p, header={"metadata": os.path.join(out_dir, METADATA_FILE)}),
+        BM25_FILE: lambda p: build_bm25(texts, p),
+        MANIFEST_FILE: lambda p: _write_json(p, new_manifest),
+        INDEX_FILE: lambda p: faiss.write_index(index, p),
+    }
+    staged = []
+    for name, write in targets.items():
+        tmp_path = os.path.join(out_dir, f".building.{name}")
+        write(tmp_path)
+        staged.append((tmp_path, os.path.join(out_dir, name)))
+    for tmp_path, final_path in staged:
+        os.replace(tmp_path, final_path)
+
+    print(f"✅ Index written: {index.ntotal} vectors, {matrix.shape[1]} dims, {index_type} → {out_dir}/{INDEX_FILE}")
+    return new_manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally rebuild the FAISS index from data/.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--out-dir", default=INDEX_DIR)
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4·sqrt(n))")
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS,
+                        help="shortened embedding size, e.g. 256 or 512 (default: the model's full size)")
+    args = parser.parse_args(argv)
+
+    build(args.data_dir, args.out_dir, args.model, args.batch_size, args.concurrency,
+          index_type=args.index_type, nlist=args.nlist, hnsw_m=args.hnsw_m, ef_construction=args.ef_construction,
+          dimensions=args.dimensions)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
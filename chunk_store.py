@@ -0,0 +1,153 @@
+"""
+===============================================================
+ Packed chunk store
+===============================================================
+ Packs every chunk text referenced by the FAISS metadata into a
+ single contiguous file, with an offset/length table aligned to
+ the FAISS ids. The API mmaps the pack once at startup and slices
+ chunk text out of it instead of opening one file per hit.
+
+ Chunk text is redacted (redaction.py) while packing; the header
+ records the redaction version so the API can skip per-request
+ redaction.
+
+ Layout (little-endian):
+   8 bytes   magic  b"PCHUNKS1"
+   u32       number of entries
+   u32       length of the JSON header
+   ...       JSON header (build info), padded to 8 bytes
+   i64 x 2n  (offset, length) per FAISS id, relative to the blob
+   ...       blob of UTF-8 chunk texts (identical texts stored once)
+
+ Build:  python chunk_store.py
+===============================================================
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import argparse
+from datetime import datetime
+
+from redaction import Redactor
+
+MAGIC = b"PCHUNKS1"
+_PREFIX = struct.Struct("<8sII")
+
+DEFAULT_PACK_PATH = "faiss_index/police_chunks.pack"
+DEFAULT_METADATA_PATH = "faiss_index/police_metadata.json"
+DEFAULT_DATA_DIR = "data"
+
+
+def _pad8(n):
+    return (8 - n % 8) % 8
+
+
+def write_pack(texts, out_path, header=None):
+    """Write an iterable of chunk texts (in FAISS id order) to a pack file."""
+    texts = list(texts)
+    blob = bytearray()
+    table = []
+    seen = {}
+
+    for text in texts:
+        data = text.encode("utf-8")
+        digest = hashlib.sha1(data).digest()
+        if digest not in seen:
+            seen[digest] = (len(blob), len(data))
+            blob += data
+        table.append(seen[digest])
+
+    header = dict(header or {})
+    header.update({
+        "count": len(table),
+        "unique": len(seen),
+        "created": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+    })
+    header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, len(table), len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * _pad8(_PREFIX.size + len(header_bytes)))
+        f.write(struct.pack(f"<{2 * len(table)}q", *[v for pair in table for v in pair]))
+        f.write(blob)
+    os.replace(tmp_path, out_path)
+    return header
+
+
+def read_chunk_texts(metadata, data_dir=DEFAULT_DATA_DIR):
+    for entry in metadata:
+        with open(os.path.join(data_dir, entry["chunk_file"]), "r", encoding="utf-8") as f:
+            yield f.read().strip()
+
+
+def write_redacted_pack(texts, out_path=DEFAULT_PACK_PATH, redactor=None, header=None):
+    """Redact chunk texts once and pack them, stamping the pack with the redaction version."""
+    redactor = redactor or Redactor.from_file()
+    header = dict(header or {}, redaction_version=redactor.version)
+    return write_pack((redactor.redact(text) for text in texts), out_path, header=header)
+
+
+def pack_from_metadata(metadata, data_dir=DEFAULT_DATA_DIR, out_path=DEFAULT_PACK_PATH, header=None, redactor=None):
+    """Read, redact and pack every chunk listed in ``metadata``, keeping FAISS id order."""
+    return write_redacted_pack(read_chunk_texts(metadata, data_dir), out_path, redactor=redactor, header=header)
+
+
+class ChunkStore:
+    """Read-only, mmap-backed view over a pack written by ``write_pack``."""
+
+    def __init__(self, path=DEFAULT_PACK_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, header_len = _PREFIX.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chunk pack")
+
+        header_start = _PREFIX.size
+        self.header = json.loads(self._mm[header_start:header_start + header_len])
+
+        table_start = header_start + header_len + _pad8(header_start + header_len)
+        self._blob_start = table_start + 16 * count
+        self._view = memoryview(self._mm)
+        self._table = self._view[table_start:self._blob_start].cast("q")
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def raw(self, i):
+        """Zero-copy memoryview of the UTF-8 bytes for FAISS id ``i``."""
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        offset = self._blob_start + self._table[2 * i]
+        return self._view[offset:offset + self._table[2 * i + 1]]
+
+    def __getitem__(self, i):
+        return str(self.raw(int(i)), "utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack chunk texts into a single mmap-able file.")
+    parser.add_argument("--metadata", default=DEFAULT_METADATA_PATH)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--out", default=DEFAULT_PACK_PATH)
+    args = parser.parse_args(argv)
+
+    with open(args.metadata, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    header = pack_from_metadata(metadata, args.data_dir, args.out, header={"metadata": args.metadata})
+    size_mb = os.path.getsize(args.out) / (1024 * 1024)
+    print(f"📦 Packed {header['count']} chunks ({header['unique']} unique) into {args.out} ({size_mb:.1f} MB), "
+          f"redaction {header['redaction_version']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+===============================================================
+ Token-budgeted context packing
+===============================================================
+ Fills a token budget greedily from ranked chunks, instead of a
+ fixed number of chunks: every candidate that still fits is kept,
+ in rank order, and a top hit larger than the whole budget is
+ truncated rather than dropped.
+
+ Neighbouring chunks of one source_file share an overlap window
+ (50 words in the current corpus). When both are picked, the words
+ already present are cut from the second so they are not sent (and
+ paid for) twice; exact duplicate texts are skipped.
+
+ Tokens are counted with tiktoken (the model's encoding) when it
+ is installed, otherwise estimated at ~4 characters per token.
+===============================================================
+"""
+import re
+import hashlib
+import threading
+
+SEPARATOR = "\n\n---\n\n"
+CHARS_PER_TOKEN = 4
+MAX_OVERLAP_WORDS = 250
+MIN_CHUNK_TOKENS = 20
+WORD_RE = re.compile(r"\S+")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding(model="gpt-4"):
+    """tiktoken encoding for ``model``, or False when tiktoken is unavailable."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.encoding_for_model(model)
+                except Exception as e:
+                    print(f"⚠️ tiktoken unavailable ({e}); estimating tokens at {CHARS_PER_TOKEN} characters each")
+                    _encoding = False
+    return _encoding
+
+
+def tokenizer_name():
+    encoding = _get_encoding()
+    return encoding.name if encoding else "approximate"
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text, budget):
+    """The longest prefix of ``text`` within ``budget`` tokens (cut at a word boundary when estimating)."""
+    if budget <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= budget else encoding.decode(tokens[:budget])
+    limit = budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit + 1)
+    return text[:cut if cut > 0 else limit]
+
+
+def overlap_words(earlier, later, max_words=MAX_OVERLAP_WORDS):
+    """Number of words at the end of ``earlier`` repeated at the start of ``later``."""
+    a, b = earlier.split(), later.split()
+    for k in range(min(len(a), len(b), max_words), 0, -1):
+        if a[-k] == b[0] and a[-k:] == b[:k]:
+            return k
+    return 0
+
+
+def _drop_leading_words(text, n):
+    spans = list(WORD_RE.finditer(text))
+    return text[spans[n - 1].end():].lstrip() if n < len(spans) else ""
+
+
+def _drop_trailing_words(text, n):
+    spans = list(WORD_RE.finditer(text))
+    return text[:spans[-n].start()].rstrip() if n < len(spans) else ""
+
+
+def pack_context(candidates, budget, separator=SEPARATOR):
+    """
+    Pack ranked candidates ({"id", "text", "source_file", "chunk_number"}) into one
+    context string of at most ``budget`` tokens. Returns (context, info).
+    """
+    separator_tokens = count_tokens(separator)
+    selected = []
+    seen_texts = set()
+    picked = {}
+    used = 0
+    deduplicated = 0
+    trimmed_words = 0
+    truncated = False
+
+    for candidate in candidates:
+        text = candidate["text"].strip()
+        digest = hashlib.sha1(text.encode("utf-8")).digest()
+        if not text or digest in seen_texts:
+            deduplicated += 1
+            continue
+
+        # Cut the overlap window shared with an already-picked neighbour from the same file
+        source, number = candidate.get("source_file"), candidate.get("chunk_number")
+        previous = picked.get((source, number - 1)) if number is not None else None
+        following = picked.get((source, number + 1)) if number is not None else None
+        if previous is not None:
+            k = overlap_words(previous, text)
+            text, trimmed_words = _drop_leading_words(text, k), trimmed_words + k
+        if following is not None and text:
+            k = overlap_words(text, following)
+            text, trimmed_words = _drop_trailing_words(text, k), trimmed_words + k
+        if not text:
+            deduplicated += 1
+            continue
+
+        cost = count_tokens(text) + (separator_tokens if selected else 0)
+        if used + cost > budget:
+            if selected or budget - used < MIN_CHUNK_TOKENS:
+                continue
+            text = truncate_to_tokens(text, budget)
+            cost = count_tokens(text)
+            truncated = True
+
+        selected.append((candidate["id"], text))
+        seen_texts.add(digest)
+        picked[(source, number)] = candidate["text"].strip()
+        used += cost
+        if budget - used < MIN_CHUNK_TOKENS:
+            break
+
+    context = separator.join(text for _, text in selected)
+    return context, {
+        "tokenizer": tokenizer_name(),
+        "budget": budget,
+        "tokens": used,
+        "candidates": len(candidates),
+        "chunks": [chunk_id for chunk_id, _ in selected],
+        "deduplicated": deduplicated,
+        "overlap_words_removed": trimmed_words,
+        "truncated": truncated,
+    }
@@ -0,0 +1,179 @@
+"""
+===============================================================
+ Query embedding cache
+===============================================================
+ Sits in front of client.embeddings.create so repeat queries skip
+ the network round trip. Two tiers:
+
+   • an in-process LRU (bounded by EMBEDDING_CACHE_SIZE)
+   • an optional SQLite file (EMBEDDING_CACHE_PATH) shared by all
+     gunicorn workers on the instance, bounded by
+     EMBEDDING_CACHE_DISK_SIZE rows (oldest written first out,
+     checked every TRIM_EVERY writes)
+
+ Keys are the embedding model plus the normalised query text
+ (whitespace collapsed, case folded). The normalised form is only
+ the key: a miss embeds the query as typed (newlines flattened,
+ as build_index.py does), so casing still reaches the model.
+ Vectors are stored as float32 blobs.
+===============================================================
+"""
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+from sqlite_local import LocalConnections
+
+
+def normalise_query(text):
+    return re.sub(r"\s+", " ", text or "").strip().casefold()
+
+
+def embedding_input(text):
+    """The text sent to the embeddings API for a query."""
+    return (text or "").replace("\n", " ")
+
+
+TRIM_EVERY = 64
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries=2048, path=None, max_disk_entries=20000):
+        self.max_entries = max_entries
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._writes = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._connections = LocalConnections(path, synchronous="NORMAL")
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        key TEXT PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        dim INTEGER NOT NULL,
+                        vector BLOB NOT NULL,
+                        created REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS embeddings_created ON embeddings (created)")
+
+    def _connect(self):
+        return self._connections.get()
+
+    @staticmethod
+    def key(text, model):
+        return hashlib.sha1(f"{model}\n{normalise_query(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def get(self, text, model):
+        key = self.key(text, model)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        if self.path:
+            try:
+                row = self._connect().execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print("⚠️ Embedding cache read failed:", str(e))
+                row = None
+            if row is not None:
+                vector = array("f", row[0]).tolist()
+                self._remember(key, vector)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, model, vector):
+        key = self.key(text, model)
+        self._remember(key, list(vector))
+        if self.path:
+            with self._lock:
+                self._writes += 1
+                trim = self.max_disk_entries and self._writes % TRIM_EVERY == 0
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created) VALUES (?, ?, ?, ?, ?)",
+                        (key, model, len(vector), array("f", vector).tobytes(), time.time())
+                    )
+                    if trim:
+                        self.trim(conn)
+            except sqlite3.Error as e:
+                print("⚠️ Embedding cache write failed:", str(e))
+
+    def get_or_create(self, text, model, embed):
+        """Return the cached vector for ``text`` or call ``embed(embedding_input(text))`` and cache it."""
+        vector = self.get(text, model)
+        if vector is None:
+            vector = embed(embedding_input(text))
+            self.put(text, model, vector)
+        return vector
+
+    def get_or_create_many(self, texts, model, embed_many):
+        """Vectors for ``texts``, with every miss embedded in one ``embed_many(inputs)`` call.
+
+        Misses sharing a cache key are embedded once, as the first of them was typed.
+        """
+        vectors = [self.get(text, model) for text in texts]
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(normalise_query(texts[i]), []).append(i)
+        if missing:
+            inputs = [embedding_input(texts[positions[0]]) for positions in missing.values()]
+            for positions, vector in zip(missing.values(), embed_many(inputs)):
+                for i in positions:
+                    vectors[i] = vector
+                self.put(texts[positions[0]], model, vector)
+        return vectors
+
+    def trim(self, conn=None):
+        """Delete the oldest rows beyond max_disk_entries; returns how many went."""
+        if conn is None:
+            with self._connect() as conn:
+                return self.trim(conn)
+        return conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        ).rowcount
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._lru),
+                "max_entries": self.max_entries,
+                "path": self.path,
+                "max_disk_entries": self.max_disk_entries if self.path else None,
+            }
@@ -1,4 +1,9 @@
 #!/bin/bash
 
+if [ "${ASGI:-0}" = "1" ]; then
+    echo "Starting Gunicorn (async workers)..."
+    exec python3 -m gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:10000
+fi
+
 echo "Starting Gunicorn..."
 exec python3 -m gunicorn api:app --bind 0.0.0.0:10000
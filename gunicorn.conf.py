@@ -0,0 +1,74 @@
+"""
+===============================================================
+ Gunicorn settings (read automatically from the working directory)
+===============================================================
+   WEB_CONCURRENCY   number of workers (default 1); above 1, async
+                     jobs are kept in a shared SQLite file unless
+                     JOB_STORE_PATH names one, so /jobs/<id> answers
+                     on every worker
+   GUNICORN_PRELOAD  1 = import the app, and load the FAISS index,
+                     BM25 arrays and chunk pack, once in the master
+                     before forking; workers share those pages
+                     copy-on-write instead of each loading its own
+   FAISS_MMAP        1 = map the index file read-only (api.py), so
+                     workers share it through the page cache even
+                     without preload
+   GUNICORN_TIMEOUT  seconds a worker may spend on one request
+                     before it is killed (default 300). Sized for a
+                     synchronous /generate/batch at the default
+                     limits: 50 enquiries, 4 at a time, up to two
+                     GPT-4 calls each. Larger or slower batches should
+                     be sent with async=1 and fetched from
+                     /jobs/<id>/archive.
+   METRICS_DIR       directory where each worker snapshots its
+                     metrics, so /metrics on any worker reports all
+                     of them; cleared when the master starts
+
+ Each worker logs its startup report once it is ready: index load
+ time (0 when preloaded) and RSS / PSS / shared memory.
+===============================================================
+"""
+import os
+import sys
+import glob
+
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "0").lower() in ("1", "true", "yes")
+
+# A background loader thread in the master would not survive the fork
+if preload_app:
+    os.environ.setdefault("INDEX_LOAD", "sync")
+
+
+def on_starting(server):
+    # Snapshots left by a previous run would be summed into this one
+    metrics_dir = os.getenv("METRICS_DIR")
+    if metrics_dir:
+        for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+            os.remove(path)
+
+
+def post_worker_init(worker):
+    from timing import process_memory
+
+    app_module = sys.modules.get("api")
+    startup = getattr(app_module, "STARTUP", {})
+    preloaded = startup.get("pid") != os.getpid()
+    memory = process_memory()
+    load_time = 0 if preloaded else startup.get("index_load_s")
+    worker.log.info(
+        "🧮 Worker %s ready: index load %s%s%s, RSS %s MB, PSS %s MB, shared %s MB",
+        os.getpid(),
+        "in background" if load_time is None else f"{load_time}s",
+        " (preloaded)" if preloaded else "",
+        " (FAISS mmap)" if startup.get("faiss_mmap") else "",
+        memory.get("rss_mb"), memory.get("pss_mb", "n/a"), memory.get("shared_mb", "n/a"),
+    )
+
+    # Background threads started in a preloading master do not survive the fork
+    outbox = getattr(app_module, "mail_outbox", None)
+    if outbox is not None:
+        outbox.start()
+    if getattr(app_module, "METRICS_DIR", None):
+        app_module.metrics.start_exporter(app_module.METRICS_DIR)
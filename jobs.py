@@ -0,0 +1,227 @@
+"""
+===============================================================
+ Background jobs for asynchronous /generate requests
+===============================================================
+ A job records the payload, its status (queued → running →
+ done / failed), per-stage timings and the final result.
+
+ Two stores, no external services required:
+   • MemoryJobStore  — dict in the current process
+   • SQLiteJobStore  — file shared by every gunicorn worker, so
+                       /jobs/<id> answers on whichever worker
+                       receives the poll
+
+ Jobs are executed by a local thread pool in the process that
+ accepted them.
+
+ Finished jobs (done or failed) are pruned whenever a job is
+ created: those finished more than ttl seconds ago, then the
+ oldest beyond max_finished. Queued and running jobs are never
+ pruned.
+
+ The payload only lives in the accepting process's thread pool,
+ so every SQLite row records its owner (pid and process start
+ time). When the store opens, and when an unfinished job is
+ polled, jobs whose owner has exited are marked failed instead of
+ staying queued for ever.
+===============================================================
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlite_local import LocalConnections
+from timing import StageTimer
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+FINISHED = (DONE, FAILED)
+ORPHANED = "worker exited before the job finished"
+
+
+def process_token(pid=None):
+    """``pid:start`` for a process; the start time (from /proc) tells a live owner from a reused pid."""
+    pid = pid or os.getpid()
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            start = f.read().rsplit(b")", 1)[1].split()[19].decode()
+    except (OSError, IndexError):
+        start = ""
+    return f"{pid}:{start}"
+
+
+def owner_alive(token):
+    pid, _, start = (token or "").partition(":")
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # alive, under another user
+    return not start or process_token(int(pid)) == token
+
+
+class MemoryJobStore:
+    def __init__(self, ttl=86400, max_finished=1000):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._prune(time.time())
+            self._jobs[job["id"]] = dict(job)
+
+    def _prune(self, now):
+        finished = sorted((j.get("finished") or 0, j["id"]) for j in self._jobs.values() if j["status"] in FINISHED)
+        expired = [job_id for when, job_id in finished if self.ttl and now - when > self.ttl]
+        if self.max_finished is not None:
+            expired += [job_id for _, job_id in finished[len(expired):max(0, len(finished) - self.max_finished)]]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class SQLiteJobStore:
+    _COLUMNS = ("id", "status", "created", "started", "finished", "timings", "result", "error", "owner")
+    _JSON_COLUMNS = ("timings", "result")
+
+    def __init__(self, path, ttl=86400, max_finished=1000):
+        self.path = path
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._connections = LocalConnections(path)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL,
+                    timings TEXT,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT
+                )
+            """)
+            if "owner" not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (status, finished)")
+        self.fail_orphans()
+
+    def _connect(self):
+        return self._connections.get()
+
+    def _encode(self, fields):
+        return {k: json.dumps(v) if k in self._JSON_COLUMNS and v is not None else v for k, v in fields.items()}
+
+    def create(self, job):
+        row = self._encode({k: job.get(k) for k in self._COLUMNS})
+        with self._connect() as conn:
+            self._prune(conn, time.time())
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})",
+                tuple(row.values())
+            )
+
+    def _prune(self, conn, now):
+        removed = 0
+        if self.ttl:
+            removed += conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?", (*FINISHED, now - self.ttl)
+            ).rowcount
+        if self.max_finished is not None:
+            removed += conn.execute(
+                """DELETE FROM jobs WHERE id IN (
+                       SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY finished DESC LIMIT -1 OFFSET ?)""",
+                (*FINISHED, self.max_finished)
+            ).rowcount
+        return removed
+
+    def fail_orphans(self, job_id=None):
+        """Mark queued / running jobs (all, or just ``job_id``) failed when their owning process is gone."""
+        query = "SELECT id, owner FROM jobs WHERE status IN (?, ?)"
+        params = (QUEUED, RUNNING)
+        if job_id is not None:
+            query, params = query + " AND id = ?", params + (job_id,)
+        orphans = [row[0] for row in self._connect().execute(query, params).fetchall() if not owner_alive(row[1])]
+        with self._connect() as conn:
+            for orphan in orphans:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ? AND status IN (?, ?)",
+                    (FAILED, time.time(), ORPHANED, orphan, QUEUED, RUNNING)
+                )
+        if orphans and job_id is None:
+            print(f"⚠️ {len(orphans)} jobs left unfinished by an exited worker marked failed")
+        return len(orphans)
+
+    def update(self, job_id, **fields):
+        row = self._encode(fields)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in row)} WHERE id = ?",
+                (*row.values(), job_id)
+            )
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self._COLUMNS, row))
+        if job["status"] in (QUEUED, RUNNING) and self.fail_orphans(job_id):
+            return self.get(job_id)
+        for k in self._JSON_COLUMNS:
+            if job[k] is not None:
+                job[k] = json.loads(job[k])
+        return job
+
+
+class JobRunner:
+    """Runs ``handler(payload, timer)`` on a thread pool and records its result and timings."""
+
+    def __init__(self, handler, store=None, max_workers=2):
+        self.handler = handler
+        self.store = store or MemoryJobStore()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generate-job")
+
+    def submit(self, payload):
+        job_id = uuid.uuid4().hex
+        self.store.create({"id": job_id, "status": QUEUED, "created": time.time(), "owner": process_token()})
+        self._pool.submit(self._run, job_id, payload)
+        return job_id
+
+    def _run(self, job_id, payload):
+        self.store.update(job_id, status=RUNNING, started=time.time())
+        timer = StageTimer()
+        try:
+            result = self.handler(payload, timer)
+        except Exception as e:
+            print(f"❌ Job {job_id} failed:", str(e))
+            self.store.update(job_id, status=FAILED, finished=time.time(), error=str(e), timings=timer.as_dict())
+            return
+        self.store.update(job_id, status=DONE, finished=time.time(), result=result, timings=timer.as_dict())
+
+    def get(self, job_id):
+        return self.store.get(job_id)
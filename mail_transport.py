@@ -0,0 +1,228 @@
+"""
+===============================================================
+ Mailjet transport
+===============================================================
+ One shared requests.Session per process (keep-alive, pooled TLS
+ connections) with explicit connect/read timeouts and bounded
+ exponential backoff on 429, 5xx and on failures to connect. A
+ read timeout or a connection lost mid-request is not retried:
+ Mailjet may already have sent the mail, and a second call would
+ email every recipient twice. A Retry-After header is honoured up to max_wait seconds
+ (MAILJET_MAX_RETRY_WAIT), as is the backoff itself.
+
+ With a batch window set (MAILJET_BATCH_WINDOW, seconds), sends
+ that arrive within the window are merged into a single
+ /v3.1/send call — the API accepts many Messages per call — and
+ each caller gets back its own slice of the response, with a 200
+ status when every message in its slice succeeded, whatever the
+ other callers' messages did.
+
+ MAILJET_API_URL points the transport at another host, e.g. a
+ local stub server.
+
+ AsyncMailjetTransport is the same client for the ASGI entrypoint
+ (asgi_app.py), on a pooled httpx.AsyncClient.
+===============================================================
+"""
+import os
+import time
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class MailjetTransport:
+    def __init__(self, api_key, secret_key, base_url="https://api.mailjet.com", connect_timeout=3.05,
+                 read_timeout=20, max_retries=4, backoff=0.5, max_wait=10.0, batch_window=0.0, max_batch_messages=50):
+        self.auth = (api_key, secret_key)
+        self.url = f"{base_url.rstrip('/')}/v3.1/send"
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.batch_window = batch_window
+        self.max_batch_messages = max_batch_messages
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._queue = queue.Queue()
+        self._batcher = None
+        self._batcher_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **overrides):
+        options = dict(
+            base_url=os.getenv("MAILJET_API_URL", "https://api.mailjet.com"),
+            connect_timeout=float(os.getenv("MAILJET_CONNECT_TIMEOUT", "3.05")),
+            read_timeout=float(os.getenv("MAILJET_READ_TIMEOUT", "20")),
+            max_retries=int(os.getenv("MAILJET_MAX_RETRIES", "4")),
+            max_wait=float(os.getenv("MAILJET_MAX_RETRY_WAIT", "10")),
+            batch_window=float(os.getenv("MAILJET_BATCH_WINDOW", "0")),
+        )
+        options.update(overrides)
+        return cls(os.getenv("MJ_APIKEY_PUBLIC"), os.getenv("MJ_APIKEY_PRIVATE"), **options)
+
+    def worst_case_seconds(self):
+        """Longest one send() can take: every attempt timing out, with the longest allowed wait between them."""
+        attempts = self.max_retries + 1
+        return self.batch_window + attempts * sum(self.timeout) + self.max_retries * self.max_wait
+
+    def _post(self, messages):
+        """POST one batch, retrying retryable failures; returns (status, body)."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, auth=self.auth, json={"Messages": messages}, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not self._unsent(e):
+                    return self._no_answer(e)
+                if attempt == self.max_retries:
+                    return 503, {"error": f"Mailjet unreachable: {e}"}
+                wait = self._retry_wait(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    try:
+                        body = response.json()
+                    except ValueError:
+                        body = {"error": response.text[:500]}
+                    return response.status_code, body
+                wait = self._retry_wait(attempt, response.headers.get("Retry-After", ""))
+
+            print(f"🔁 Mailjet send retry {attempt + 1}/{self.max_retries} in {wait:.1f}s")
+            time.sleep(wait)
+
+    @staticmethod
+    def _unsent(error):
+        """True when the request never reached Mailjet (no connection, or the connect timed out)."""
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    @staticmethod
+    def _no_answer(error):
+        error = str(error) or type(error).__name__
+        print(f"⚠️ No answer from Mailjet, not retried (the messages may have been sent): {error}")
+        return 504, {"error": f"No answer from Mailjet; the messages may have been sent: {error}"}
+
+    def _retry_wait(self, attempt, retry_after=""):
+        wait = float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt
+        return min(wait, self.max_wait)
+
+    def send(self, messages):
+        if self.batch_window <= 0:
+            return self._post(messages)
+
+        self._ensure_batcher()
+        future = Future()
+        self._queue.put((messages, future))
+        return future.result()
+
+    def _ensure_batcher(self):
+        if self._batcher is None:
+            with self._batcher_lock:
+                if self._batcher is None:
+                    self._batcher = threading.Thread(target=self._run_batcher, name="mailjet-batcher", daemon=True)
+                    self._batcher.start()
+
+    def _run_batcher(self):
+        while True:
+            pending = [self._queue.get()]
+            count = len(pending[0][0])
+            deadline = time.monotonic() + self.batch_window
+            while count < self.max_batch_messages:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                count += len(item[0])
+
+            try:
+                self._flush(pending)
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _flush(self, pending):
+        combined = [message for messages, _ in pending for message in messages]
+        status, body = self._post(combined)
+        if len(pending) > 1:
+            print(f"📦 Mailjet batch: {len(pending)} reports, {len(combined)} messages in one call")
+
+        results = body.get("Messages") if isinstance(body, dict) else None
+        if not isinstance(results, list) or len(results) != len(combined):
+            # Whole-batch failure: every caller sees the same response
+            for _, future in pending:
+                future.set_result((status, body))
+            return
+
+        start = 0
+        for messages, future in pending:
+            own = results[start:start + len(messages)]
+            # One bad recipient fails the whole call's status; callers whose messages all went out still get a 200
+            delivered = all(isinstance(r, dict) and r.get("Status") == "success" for r in own)
+            future.set_result((200 if delivered and not 200 <= status < 300 else status, {"Messages": own}))
+            start += len(messages)
+
+
+class AsyncMailjetTransport(MailjetTransport):
+    """MailjetTransport for asyncio callers; one httpx.AsyncClient per event loop."""
+
+    def __init__(self, *args, max_connections=32, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_connections = max_connections
+        self._client = None
+
+    def _async_client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                auth=self.auth,
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def send(self, messages):
+        import httpx
+        client = self._async_client()
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await client.post(self.url, json={"Messages": messages})
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                # Never sent, so safe to retry; other transport errors may come after Mailjet got the request
+                if attempt == self.max_retries:
+                    return 503, {"error": f"Mailjet unreachable: {e}"}
+                wait = self._retry_wait(attempt)
+            except httpx.TransportError as e:
+                return self._no_answer(e)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    try:
+                        body = response.json()
+                    except ValueError:
+                        body = {"error": response.text[:500]}
+                    return response.status_code, body
+                wait = self._retry_wait(attempt, response.headers.get("Retry-After", ""))
+
+            print(f"🔁 Mailjet send retry {attempt + 1}/{self.max_retries} in {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
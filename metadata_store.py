@@ -0,0 +1,153 @@
+"""
+===============================================================
+ Columnar chunk metadata
+===============================================================
+ Replaces json.load of a list of thousands of dicts in every
+ worker with a single mmap-able file of flat columns:
+
+   source_id     int32   index into the interned source_file table
+   discipline_id int32   index into the interned discipline table
+   chunk_number  int32
+   word_count    int32
+   file_offsets  int64   [N + 1] offsets of chunk_file names in the blob
+   path_offsets  int64   [N + 1] offsets of chunk_path values in the blob
+   blob          uint8   UTF-8 chunk_file and chunk_path strings
+
+ MetadataStore[i] returns the same dict the JSON file used to hold,
+ built on demand for the handful of ids a request touches.
+
+ Build:  python metadata_store.py
+===============================================================
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+import argparse
+
+import numpy as np
+
+MAGIC = b"PMETA001"
+_PREFIX = struct.Struct("<8sII")
+
+DEFAULT_METADATA_STORE_PATH = "faiss_index/police_metadata.bin"
+DEFAULT_SOURCE_PATH = "faiss_index/police_metadata_tagged.json"
+
+
+def _intern(values):
+    table, ids = {}, []
+    for value in values:
+        ids.append(table.setdefault(value, len(table)))
+    return list(table), np.array(ids, dtype="int32")
+
+
+def _offsets(strings, start):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return b"".join(encoded), offsets + start
+
+
+def pack_metadata(entries):
+    """Serialise a list of metadata dicts into the columnar format (bytes)."""
+    sources, source_ids = _intern(e["source_file"] for e in entries)
+    disciplines, discipline_ids = _intern(e.get("discipline", "general") for e in entries)
+    file_blob, file_offsets = _offsets([e["chunk_file"] for e in entries], 0)
+    path_blob, path_offsets = _offsets([e.get("chunk_path", f"data/{e['chunk_file']}") for e in entries], len(file_blob))
+
+    columns = {
+        "source_id": source_ids,
+        "discipline_id": discipline_ids,
+        "chunk_number": np.array([e["chunk_number"] for e in entries], dtype="int32"),
+        "word_count": np.array([e["word_count"] for e in entries], dtype="int32"),
+        "file_offsets": file_offsets,
+        "path_offsets": path_offsets,
+        "blob": np.frombuffer(file_blob + path_blob, dtype="uint8"),
+    }
+
+    layout, body, position = {}, bytearray(), 0
+    for name, array in columns.items():
+        raw = array.tobytes()
+        layout[name] = [array.dtype.str, position, len(array)]
+        body += raw + b"\0" * ((8 - len(raw) % 8) % 8)
+        position = len(body)
+
+    header = json.dumps({"columns": layout, "sources": sources, "disciplines": disciplines}).encode("utf-8")
+    header += b" " * ((8 - (_PREFIX.size + len(header)) % 8) % 8)
+    return _PREFIX.pack(MAGIC, len(entries), len(header)) + header + bytes(body)
+
+
+def write_metadata_store(entries, path=DEFAULT_METADATA_STORE_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pack_metadata(entries))
+    os.replace(tmp_path, path)
+
+
+class MetadataStore:
+    def __init__(self, buffer, path=None):
+        self.path = path
+        self._buffer = buffer
+        magic, count, header_len = _PREFIX.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path or 'buffer'} is not a metadata store")
+
+        header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_len]))
+        body_start = _PREFIX.size + header_len
+        self.sources = header["sources"]
+        self.disciplines = header["disciplines"]
+        self._count = count
+
+        for name, (dtype, offset, length) in header["columns"].items():
+            setattr(self, name, np.frombuffer(buffer, dtype=dtype, count=length, offset=body_start + offset))
+
+    @classmethod
+    def open(cls, path=DEFAULT_METADATA_STORE_PATH):
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mm, path=path)
+
+    @classmethod
+    def from_entries(cls, entries):
+        return cls(pack_metadata(entries))
+
+    def __len__(self):
+        return self._count
+
+    def _string(self, offsets, i):
+        return self.blob[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return {
+            "source_file": self.sources[self.source_id[i]],
+            "chunk_file": self._string(self.file_offsets, i),
+            "chunk_number": int(self.chunk_number[i]),
+            "word_count": int(self.word_count[i]),
+            "chunk_path": self._string(self.path_offsets, i),
+            "discipline": self.disciplines[self.discipline_id[i]],
+        }
+
+    def ids_by_discipline(self):
+        return {name: np.flatnonzero(self.discipline_id == d).astype("int64") for d, name in enumerate(self.disciplines)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert JSON chunk metadata to the columnar format.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE_PATH)
+    parser.add_argument("--out", default=DEFAULT_METADATA_STORE_PATH)
+    args = parser.parse_args(argv)
+
+    with open(args.source, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    write_metadata_store(entries, args.out)
+    size_kb = os.path.getsize(args.out) / 1024
+    print(f"🗃️ Metadata store: {len(entries)} chunks → {args.out} ({size_kb:.0f} KB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
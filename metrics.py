@@ -0,0 +1,183 @@
+"""
+===============================================================
+ Prometheus metrics (no client library needed)
+===============================================================
+ Counters and histograms kept in-process behind one lock; an
+ observation is a dict lookup and a bisect, so instrumenting the
+ hot path costs microseconds. render() writes the Prometheus text
+ exposition format for GET /metrics.
+
+ Gunicorn runs several workers and a scrape reaches only one of
+ them. With METRICS_DIR set, every worker snapshots its metrics
+ to <METRICS_DIR>/<pid>.json every few seconds, and /metrics sums
+ all snapshots (including those of workers that have exited, so
+ counters never go backwards).
+===============================================================
+"""
+import os
+import json
+import time
+import glob
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, documentation, labels=()):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self._lock = registry._lock
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        return {"values": [[list(key), value] for key, value in self.values.items()]}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = registry._lock
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        return {"buckets": list(self.buckets),
+                "values": [[list(key), [list(counts), total, count]] for key, (counts, total, count) in self.values.items()]}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._exporter_pid = None
+
+    def counter(self, name, documentation, labels=()):
+        return self._metrics.setdefault(name, Counter(self, name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(self, name, documentation, labels, buckets))
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(metric.snapshot(), kind=metric.kind, help=metric.documentation, labels=list(metric.labels))
+                    for name, metric in self._metrics.items()}
+
+    # ---- multi-worker aggregation -------------------------------------------
+
+    def _write_snapshot(self, directory):
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def start_exporter(self, directory, interval=5.0):
+        """Snapshot this worker's metrics to ``directory`` every ``interval`` seconds (fork-aware)."""
+        if self._exporter_pid == os.getpid():
+            return
+        os.makedirs(directory, exist_ok=True)
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self._write_snapshot(directory)
+                except OSError as e:
+                    print(f"⚠️ Metrics snapshot failed: {e}")
+
+        threading.Thread(target=run, name="metrics-exporter", daemon=True).start()
+        self._exporter_pid = os.getpid()
+
+    def collect(self, directory=None):
+        """This process's metrics, summed with every other worker's snapshot in ``directory``."""
+        snapshots = [self.snapshot()]
+        if directory:
+            own = os.path.join(directory, f"{os.getpid()}.json")
+            for path in glob.glob(os.path.join(directory, "*.json")):
+                if path == own:
+                    continue
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return merge_snapshots(snapshots)
+
+    def render(self, directory=None):
+        return render(self.collect(directory))
+
+
+def merge_snapshots(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, dict(metric, values={}))
+            for key, value in metric["values"]:
+                key = tuple(key)
+                if metric["kind"] == "counter":
+                    target["values"][key] = target["values"].get(key, 0) + value
+                else:
+                    counts, total, count = target["values"].get(key, ([0] * len(value[0]), 0.0, 0))
+                    target["values"][key] = ([a + b for a, b in zip(counts, value[0])], total + value[1], count + value[2])
+    return merged
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(metrics):
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name in sorted(metrics):
+        metric = metrics[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for key, value in sorted(metric["values"].items()):
+            if metric["kind"] == "counter":
+                lines.append(f"{name}{_labels(metric['labels'], key)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(metric["buckets"]) + ["+Inf"], counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{bound}"'
+                lines.append(f"{name}_bucket{_labels(metric['labels'], key, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric['labels'], key)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(metric['labels'], key)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
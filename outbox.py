@@ -0,0 +1,220 @@
+"""
+===============================================================
+ Durable mail outbox
+===============================================================
+ Rendered reports are committed to a local SQLite queue together
+ with their Mailjet messages; a background sender drains it.
+
+   • at-least-once: a row stays in the outbox until Mailjet
+     answers. A sender claims a row with a lease; if the process
+     dies mid-send the lease expires and another sender (any
+     gunicorn worker sharing the file) picks it up again. One send
+     must finish well inside lease_seconds, so ``send`` should make
+     a single attempt (api.py uses MailjetTransport with
+     max_retries=0) and leave retries to the outbox.
+   • idempotency: every row has a key (the caller's, or a fresh
+     uuid). Enqueueing the same key twice is a no-op, and each
+     message carries CustomID "<key>-<n>" so a re-send after a
+     crash can be matched up in Mailjet's event data.
+   • failures back off exponentially; after max_attempts the row
+     is parked as failed instead of retrying for ever.
+   • a finished row (sent or failed) drops its messages, which
+     carry the base64 report; the status row itself is deleted
+     after retention_seconds (MAIL_OUTBOX_RETENTION_DAYS).
+
+ Enabled in api.py by MAIL_OUTBOX_PATH.
+===============================================================
+"""
+import os
+import json
+import time
+import uuid
+import threading
+
+from sqlite_local import LocalConnections
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+class MailOutbox:
+    def __init__(self, path, send, lease_seconds=120, max_attempts=8, backoff=5.0, poll_interval=1.0,
+                 retention_seconds=7 * 86400, prune_interval=3600):
+        self.path = path
+        self.send = send
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+
+        self._connections = LocalConnections(path, timeout=10, isolation_level=None, synchronous="FULL")
+        self._wake = threading.Event()
+        self._sender_pid = None
+        self._sender_lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    lease_token TEXT,
+                    lease_until REAL,
+                    sent REAL,
+                    messages TEXT,
+                    mailjet_status INTEGER,
+                    result TEXT,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)")
+
+    def _connect(self):
+        return self._connections.get()
+
+    def enqueue(self, messages, key=None):
+        """Durably queue Mailjet messages; returns the idempotency key once committed."""
+        key = key or uuid.uuid4().hex
+        messages = [dict(message, CustomID=f"{key}-{n}") for n, message in enumerate(messages)]
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO outbox (id, status, created, next_attempt, messages) VALUES (?, ?, ?, ?, ?)",
+                (key, PENDING, now, now, json.dumps(messages))
+            ).rowcount
+        if not inserted:
+            print(f"↩️ Outbox already holds {key}; not queued twice")
+        self.start()
+        self._wake.set()
+        return key
+
+    def _claim(self):
+        """Lease the next due row (pending, or sending with an expired lease)."""
+        now = time.time()
+        token = uuid.uuid4().hex
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                """SELECT id, messages FROM outbox
+                   WHERE ((status = ? AND next_attempt <= ?) OR (status = ? AND lease_until < ?))
+                     AND messages IS NOT NULL
+                   ORDER BY next_attempt LIMIT 1""",
+                (PENDING, now, SENDING, now)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE outbox SET status = ?, lease_token = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                    (SENDING, token, now + self.lease_seconds, row[0])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], token, json.loads(row[1])
+
+    def _finish(self, key, token, **fields):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                f"UPDATE outbox SET {', '.join(f'{k} = ?' for k in fields)}, lease_token = NULL, lease_until = NULL "
+                "WHERE id = ? AND lease_token = ?",
+                (*fields.values(), key, token)
+            )
+
+    def _retry(self, key, token, error, status=None):
+        attempts = self._connect().execute("SELECT attempts FROM outbox WHERE id = ?", (key,)).fetchone()[0]
+        if attempts >= self.max_attempts:
+            print(f"❌ Outbox {key} failed after {attempts} attempts: {error}")
+            self._finish(key, token, status=FAILED, messages=None, mailjet_status=status, error=error)
+        else:
+            delay = self.backoff * 2 ** (attempts - 1)
+            print(f"🔁 Outbox {key} attempt {attempts} failed ({error}); retrying in {delay:.0f}s")
+            self._finish(key, token, status=PENDING, next_attempt=time.time() + delay, mailjet_status=status, error=error)
+
+    def process_one(self):
+        """Send one due row; returns False when nothing was due."""
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        key, token, messages = claimed
+        try:
+            status, response = self.send(messages)
+        except Exception as e:
+            self._retry(key, token, str(e))
+            return True
+
+        if 200 <= status < 300:
+            self._finish(key, token, status=SENT, messages=None, sent=time.time(), mailjet_status=status,
+                         result=json.dumps(response), error=None)
+            print(f"📤 Outbox {key} sent ({len(messages)} messages)")
+        elif status == 429 or status >= 500:
+            self._retry(key, token, json.dumps(response)[:500], status)
+        else:
+            # Mailjet rejected the messages themselves; re-sending will not help
+            self._finish(key, token, status=FAILED, messages=None, mailjet_status=status, result=json.dumps(response),
+                         error="rejected by Mailjet")
+            print(f"❌ Outbox {key} rejected by Mailjet ({status})")
+        return True
+
+    def prune(self, now=None):
+        """Delete sent and failed rows older than retention_seconds; returns how many went."""
+        now = now or time.time()
+        self._last_prune = now
+        if not self.retention_seconds:
+            return 0
+        with self._connect() as conn:
+            removed = conn.execute(
+                "DELETE FROM outbox WHERE status IN (?, ?) AND created < ?",
+                (SENT, FAILED, now - self.retention_seconds)
+            ).rowcount
+        if removed:
+            print(f"🧹 Outbox: removed {removed} finished rows")
+        return removed
+
+    def _run(self):
+        while True:
+            try:
+                while self.process_one():
+                    pass
+                if time.time() - self._last_prune >= self.prune_interval:
+                    self.prune()
+            except Exception as e:
+                print(f"⚠️ Outbox sender error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def start(self):
+        """Start the background sender for this process (idempotent, fork-aware)."""
+        if self._sender_pid == os.getpid():
+            return
+        with self._sender_lock:
+            if self._sender_pid != os.getpid():
+                self._wake = threading.Event()
+                threading.Thread(target=self._run, name="mail-outbox", daemon=True).start()
+                self._sender_pid = os.getpid()
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT id, status, created, attempts, sent, mailjet_status, result, error FROM outbox WHERE id = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(("id", "status", "created", "attempts", "sent", "mailjet_status", "result", "error"), row))
+        if entry["result"]:
+            entry["result"] = json.loads(entry["result"])
+        return entry
+
+    def stats(self):
+        counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return {"path": self.path, **{s: counts.get(s, 0) for s in (PENDING, SENDING, SENT, FAILED)}}
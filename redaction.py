@@ -0,0 +1,49 @@
+"""
+===============================================================
+ Context redaction
+===============================================================
+ Replaces force names (from redaction_terms.txt) and badge-style
+ numbers in one pass of a single compiled alternation regex.
+
+ Chunks are redacted once when the chunk pack is built and the
+ pack is stamped with Redactor.version. At query time the API only
+ compares stamps, and redacts on the fly when the pack is missing
+ or was built with a different term list.
+===============================================================
+"""
+import os
+import re
+import hashlib
+
+DEFAULT_TERMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "redaction_terms.txt")
+FORCE_REPLACEMENT = "the relevant police force"
+BADGE_REPLACEMENT = "[badge number]"
+BADGE_PATTERN = r"\b(?:PC|SGT|CID)?\d{3,5}\b"
+ENGINE_VERSION = "1"
+
+
+def load_terms(path=None):
+    path = path or os.getenv("REDACTION_TERMS_PATH", DEFAULT_TERMS_PATH)
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+class Redactor:
+    def __init__(self, terms):
+        # Longest first, so "Avon and Somerset Police" wins over any shorter overlapping term
+        self.terms = sorted(set(terms), key=len, reverse=True)
+        names = "|".join(re.escape(t) for t in self.terms) or r"(?!x)x"
+        self._pattern = re.compile(f"(?P<force>{names})|(?P<badge>(?i:{BADGE_PATTERN}))")
+        stamp = "\n".join([ENGINE_VERSION, FORCE_REPLACEMENT, BADGE_REPLACEMENT, BADGE_PATTERN, *self.terms])
+        self.version = hashlib.sha256(stamp.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def from_file(cls, path=None):
+        return cls(load_terms(path))
+
+    @staticmethod
+    def _replace(match):
+        return FORCE_REPLACEMENT if match.lastgroup == "force" else BADGE_REPLACEMENT
+
+    def redact(self, text):
+        return self._pattern.sub(self._replace, text)
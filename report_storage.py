@@ -0,0 +1,179 @@
+"""
+===============================================================
+ Report storage with retention (output/)
+===============================================================
+ Keeps a copy of every generated Word report on disk, bounded in
+ size and age, instead of one ever-growing folder per discipline:
+
+   output/objects/ab/abcdef….docx   one file per distinct report
+   output/index.jsonl               one compact JSON line per stored
+                                    report (hash, size, filename,
+                                    discipline, created), oldest first
+
+ Reports are content-addressed by their text (name, query and
+ answer) rather than their bytes: the rendered .docx embeds the
+ time it was generated, so two renders of the same report never
+ match byte for byte. A report already stored is not written again;
+ only an index line is added.
+
+ Retention runs at most every prune_interval seconds (and on
+ demand with prune()): index entries older than max_age are
+ dropped, then the oldest entries until the distinct files fit in
+ max_bytes, and files no entry refers to any more are deleted.
+ Writers in several gunicorn workers serialise on an flock.
+
+ Environment:
+   SAVE_REPORTS          0 = keep nothing on disk (default 1)
+   REPORT_STORAGE_DIR    default output
+   REPORT_MAX_MB         default 500 (0 = no size limit)
+   REPORT_MAX_AGE_DAYS   default 30 (0 = no age limit)
+===============================================================
+"""
+import os
+import json
+import time
+import fcntl
+import hashlib
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+INDEX_FILE = "index.jsonl"
+OBJECTS_DIR = "objects"
+LOCK_FILE = ".lock"
+
+
+def report_fingerprint(*parts):
+    """Content address of a report from the text it is rendered from."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").strip().encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ReportStorage:
+    def __init__(self, root="output", max_bytes=500 * 1024 * 1024, max_age=30 * 86400, prune_interval=300):
+        self.root = root
+        self.max_bytes = max_bytes or None
+        self.max_age = max_age or None
+        self.prune_interval = prune_interval
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self._last_prune = 0.0
+        self._prune_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """The configured storage, or None when SAVE_REPORTS turns persistence off."""
+        if os.getenv("SAVE_REPORTS", "1").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            os.getenv("REPORT_STORAGE_DIR", "output"),
+            max_bytes=int(float(os.getenv("REPORT_MAX_MB", "500")) * 1024 * 1024),
+            max_age=int(float(os.getenv("REPORT_MAX_AGE_DAYS", "30")) * 86400),
+        )
+
+    def path(self, digest):
+        return os.path.join(self.root, OBJECTS_DIR, digest[:2], f"{digest}.docx")
+
+    @contextmanager
+    def _locked(self):
+        # Folders are created on first use, so an unwritable root only fails the save (OSError), not startup
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        entries = []
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue  # a line cut short by a crash
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def save(self, content, filename, discipline=None, digest=None):
+        """Store ``content`` under ``digest`` (sha256 of the bytes by default); returns the index entry."""
+        digest = digest or hashlib.sha256(content).hexdigest()
+        path = self.path(digest)
+        entry = {"sha256": digest, "size": len(content), "filename": filename,
+                 "discipline": discipline, "created": round(time.time(), 3)}
+
+        with self._locked():
+            deduplicated = os.path.exists(path)
+            if not deduplicated:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+        if time.time() - self._last_prune >= self.prune_interval:
+            self.prune()
+        return dict(entry, path=path, deduplicated=deduplicated)
+
+    def prune(self, now=None):
+        """Apply the age and size limits; returns what is left and how many files were deleted."""
+        if not self._prune_lock.acquire(blocking=False):
+            return None
+        try:
+            now = now or time.time()
+            self._last_prune = now
+            with self._locked():
+                entries = self._read_index()
+                keep = [e for e in entries if not self.max_age or now - e["created"] <= self.max_age]
+
+                refs = Counter(e["sha256"] for e in keep)
+                total = sum({e["sha256"]: e["size"] for e in keep}.values())
+                oldest = 0
+                while self.max_bytes and total > self.max_bytes and oldest < len(keep):
+                    entry = keep[oldest]
+                    oldest += 1
+                    refs[entry["sha256"]] -= 1
+                    if not refs[entry["sha256"]]:
+                        total -= entry["size"]
+                keep = keep[oldest:]
+
+                live = {e["sha256"] for e in keep}
+                removed = 0
+                for digest in {e["sha256"] for e in entries} - live:
+                    try:
+                        os.remove(self.path(digest))
+                        removed += 1
+                        os.rmdir(os.path.dirname(self.path(digest)))
+                    except OSError:
+                        pass  # already gone, or the fan-out folder still holds other reports
+
+                if len(keep) != len(entries):
+                    tmp_path = f"{self.index_path}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.writelines(json.dumps(e, separators=(",", ":")) + "\n" for e in keep)
+                    os.replace(tmp_path, self.index_path)
+        finally:
+            self._prune_lock.release()
+
+        if removed:
+            print(f"🧹 Report storage: removed {removed} files, {len(keep)} reports ({total / 1024 / 1024:.1f} MB) kept")
+        return {"reports": len(keep), "files": len(live), "bytes": total, "removed_files": removed}
+
+    def stats(self):
+        entries = self._read_index()
+        sizes = {e["sha256"]: e["size"] for e in entries}
+        return {
+            "root": self.root,
+            "reports": len(entries),
+            "files": len(sizes),
+            "bytes": sum(sizes.values()),
+            "max_bytes": self.max_bytes,
+            "max_age_days": self.max_age / 86400 if self.max_age else None,
+        }
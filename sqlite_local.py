@@ -0,0 +1,35 @@
+"""
+===============================================================
+ Per-thread, per-process SQLite connections
+===============================================================
+ The embedding cache, job store and mail outbox all share one
+ SQLite file between threads and gunicorn workers. A connection
+ can be used only by the thread that opened it, and one opened
+ in a preloading master must not be reused after the fork, so
+ each (process, thread) pair opens its own on first use, in WAL
+ mode so readers never block the writer.
+===============================================================
+"""
+import os
+import sqlite3
+import threading
+
+
+class LocalConnections:
+    def __init__(self, path, timeout=5, isolation_level="", synchronous=None):
+        self.path = path
+        self.timeout = timeout
+        self.isolation_level = isolation_level
+        self.synchronous = synchronous
+        self._local = threading.local()
+
+    def get(self):
+        """This thread's connection, opened on first use (and again in a forked child)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=self.isolation_level)
+            conn.execute("PRAGMA journal_mode=WAL")
+            if self.synchronous:
+                conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
@@ -0,0 +1,62 @@
+"""
+===============================================================
+ Server-sent events for /generate/stream
+===============================================================
+ SectionStreamParser turns the raw token stream from the model
+ into SSE events:
+
+   event: section   {"title": "Action Sheet"}   for "### ..." lines
+   event: token     {"text": "..."}             for everything else
+
+ Text is passed through as soon as it arrives. Only a line that
+ could still turn into a "### " marker is held back until it is
+ complete.
+===============================================================
+"""
+import json
+
+SECTION_PREFIX = "### "
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class SectionStreamParser:
+    def __init__(self):
+        self._pending = ""
+        self._line_is_text = False
+        self.text = []
+
+    def _line_events(self, line, newline=True):
+        if not self._line_is_text and line.startswith(SECTION_PREFIX):
+            return [("section", {"title": line[len(SECTION_PREFIX):].strip()})]
+        text = line + "\n" if newline else line
+        return [("token", {"text": text})] if text else []
+
+    def feed(self, delta):
+        self.text.append(delta)
+        self._pending += delta
+        events = []
+
+        while "\n" in self._pending:
+            line, self._pending = self._pending.split("\n", 1)
+            events += self._line_events(line)
+            self._line_is_text = False
+
+        if self._pending and not self._line_is_text:
+            maybe_marker = self._pending.startswith(SECTION_PREFIX) or SECTION_PREFIX.startswith(self._pending)
+            if not maybe_marker:
+                self._line_is_text = True
+        if self._pending and self._line_is_text:
+            events.append(("token", {"text": self._pending}))
+            self._pending = ""
+        return events
+
+    def close(self):
+        line, self._pending = self._pending, ""
+        return self._line_events(line, newline=False)
+
+    @property
+    def answer(self):
+        return "".join(self.text)
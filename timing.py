@@ -0,0 +1,58 @@
+"""
+===============================================================
+ Per-stage wall-clock timings for the /generate pipeline, and
+ process memory readings for the startup report
+===============================================================
+"""
+import time
+import resource
+from contextlib import contextmanager
+
+
+class StageTimer:
+    # Called as observer(stage, seconds) after every stage, e.g. to feed /metrics
+    observers = []
+
+    def __init__(self, observe=True):
+        self.stages = {}
+        self.observe = observe
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = round(self.stages.get(name, 0.0) + elapsed, 4)
+            if self.observe:
+                for observer in self.observers:
+                    observer(name, elapsed)
+
+    def total(self):
+        return round(time.perf_counter() - self._started, 4)
+
+    def as_dict(self):
+        return dict(self.stages, total=self.total())
+
+
+def process_memory():
+    """Resident memory of this process in MB; pss/shared split out where Linux reports them."""
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty"):
+                    fields[name] = int(rest.split()[0]) / 1024
+    except OSError:
+        pass
+    if "Rss" not in fields:
+        # ru_maxrss is the peak, in KB on Linux
+        return {"rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+    return {
+        "rss_mb": round(fields["Rss"], 1),
+        "pss_mb": round(fields.get("Pss", fields["Rss"]), 1),
+        "shared_mb": round(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0), 1),
+    }